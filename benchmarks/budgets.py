@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import sys
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+import httpx
+import orjson
+from sqlalchemy import delete, event, select
+
+from src.api.auth import services as auth_services
+from src.api.files.cache import file_cache, file_changed
+from src.database import engine, replica_engines, session_factory
+from src.main import create_app
+from src.models import PendingUser as PendingUserModel
+
+from .seed import PASSWORD, USER_PREFIX, clean
+
+
+@dataclass(frozen=True)
+class Budget:
+    statements: int
+    commits: int
+    wall_ms: float
+
+
+@dataclass
+class Usage:
+    statements: int = 0
+    commits: int = 0
+    wall_ms: float = 0.0
+
+
+# Statements and COMMITs issued while serving one request, and its wall time. Download and
+# signatures assume the file metadata cache already holds the row read by GET /files/{id}.
+BUDGETS: dict[str, Budget] = {
+    'GET /auth/availability': Budget(statements=1, commits=0, wall_ms=50),
+    'POST /auth/sign_up': Budget(statements=1, commits=1, wall_ms=250),
+    'POST /auth/sign_up (taken)': Budget(statements=1, commits=0, wall_ms=50),
+    'POST /auth/verify_otp': Budget(statements=2, commits=1, wall_ms=100),
+    'POST /auth/resend_otp': Budget(statements=2, commits=1, wall_ms=100),
+    'POST /auth/sign_in': Budget(statements=2, commits=1, wall_ms=250),
+    'POST /auth/refresh': Budget(statements=4, commits=2, wall_ms=100),
+    'GET /auth': Budget(statements=1, commits=0, wall_ms=50),
+    'POST /files': Budget(statements=6, commits=2, wall_ms=200),
+    'GET /files': Budget(statements=2, commits=0, wall_ms=50),
+    'GET /files/{id}': Budget(statements=2, commits=0, wall_ms=50),
+    'GET /files/{id}/download': Budget(statements=1, commits=0, wall_ms=50),
+    'GET /files/{id}/signatures': Budget(statements=1, commits=0, wall_ms=100),
+    'PUT /files/{id}/content': Budget(statements=7, commits=2, wall_ms=200),
+    'GET /files/export': Budget(statements=2, commits=0, wall_ms=100),
+    'PATCH /files/{id}': Budget(statements=3, commits=1, wall_ms=50),
+    'DELETE /files/{id}': Budget(statements=5, commits=1, wall_ms=50),
+}
+
+SENTINEL_FILE_ID = -1
+
+current_usage: ContextVar[Usage | None] = ContextVar('current_usage', default=None)
+
+
+def count_statement(*_: object) -> None:
+    if (usage := current_usage.get()) is not None:
+        usage.statements += 1
+
+
+def count_commit(*_: object) -> None:
+    if (usage := current_usage.get()) is not None:
+        usage.commits += 1
+
+
+@dataclass
+class Flow:
+    client: httpx.AsyncClient
+    usages: dict[str, Usage] = field(default_factory=dict)
+    otps: dict[str, str] = field(default_factory=dict)
+    headers: dict[str, str] = field(default_factory=dict)
+
+    async def request(
+        self,
+        name: str,
+        url: str,
+        expected_status: int = 200,
+        **kwargs: object,
+    ) -> httpx.Response:
+        method = name.partition(' ')[0]
+        usage = Usage()
+        token = current_usage.set(usage)
+        start = time.perf_counter()
+
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)  # type: ignore[arg-type]
+        finally:
+            usage.wall_ms = (time.perf_counter() - start) * 1000
+            current_usage.reset(token)
+
+        if response.status_code != expected_status:
+            raise RuntimeError(f'{name} returned {response.status_code}: {response.text}')
+
+        self.usages[name] = usage
+
+        return response
+
+    async def run(self, suffix: str) -> None:
+        name = f'{USER_PREFIX}budget_{suffix}'
+        email = f'{name}@example.com'
+        credentials = {'name': name, 'password': PASSWORD}
+
+        await self.request('GET /auth/availability', f'/auth/availability?name={name}')
+        await self.request(
+            'POST /auth/sign_up', '/auth/sign_up', json={**credentials, 'email': email}
+        )
+        await self.request('POST /auth/resend_otp', f'/auth/resend_otp?email={email}')
+        await self.request(
+            'POST /auth/verify_otp',
+            '/auth/verify_otp',
+            json={'email': email, 'otp': self.otps[email]},
+        )
+        await self.request(
+            'POST /auth/sign_up (taken)',
+            '/auth/sign_up',
+            409,
+            json={**credentials, 'email': email},
+        )
+        response = await self.request('POST /auth/sign_in', '/auth/sign_in', json=credentials)
+
+        self.headers = {'Authorization': f'Bearer {response.json()["refresh_token"]}'}
+        response = await self.request('POST /auth/refresh', '/auth/refresh')
+
+        self.headers = {'Authorization': f'Bearer {response.json()["access_token"]}'}
+        await self.request('GET /auth', '/auth')
+
+        content = b'x' * (256 * 1024)
+        await self.request('POST /files', '/files', 201, files={'file': ('budget.bin', content)})
+        response = await self.request('GET /files', '/files')
+        file_id = response.json()[0]['id']
+
+        await self.request('GET /files/{id}', f'/files/{file_id}')
+        await self.request('GET /files/{id}/download', f'/files/{file_id}/download')
+        await self.request('GET /files/{id}/signatures', f'/files/{file_id}/signatures')
+        delta = {'block_size': 16 * 1024, 'ops': [{'copy': 0, 'count': 16}, {'data': 4}]}
+        await self.request(
+            'PUT /files/{id}/content',
+            f'/files/{file_id}/content',
+            data={'delta': orjson.dumps(delta).decode()},
+            files={'data': ('data', b'tail')},
+        )
+        await self.request('GET /files/export', '/files/export')
+        await self.request('PATCH /files/{id}', f'/files/{file_id}', json={'name': 'renamed'})
+        await self.request('DELETE /files/{id}', f'/files/{file_id}', 204)
+
+        self.headers = {}
+
+    async def capture_otp(self, to_email: str, otp: str) -> None:
+        self.otps[to_email] = otp
+
+
+async def settle_file_cache() -> None:
+    async with asyncio.timeout(10):
+        while not file_cache.listening:
+            await asyncio.sleep(0.01)
+
+        # Notifications arrive in commit order, so once the sentinel is evicted every earlier
+        # invalidation has been applied and none can land during the measured pass.
+        sentinel = SimpleNamespace(id=SENTINEL_FILE_ID)
+        file_cache.put(sentinel, file_cache.version)  # type: ignore[arg-type]
+
+        async with session_factory() as session:
+            await session.execute(select(file_changed(SENTINEL_FILE_ID)))
+            await session.commit()
+
+        while file_cache.get(SENTINEL_FILE_ID) is not None:
+            await asyncio.sleep(0.01)
+
+
+async def clean_up() -> None:
+    async with session_factory() as session:
+        await clean(session)
+        await session.execute(
+            delete(PendingUserModel).where(PendingUserModel.name.startswith(USER_PREFIX))
+        )
+        await session.commit()
+
+
+async def main(args: argparse.Namespace) -> int:
+    for bound_engine in [engine, *replica_engines]:
+        event.listen(bound_engine.sync_engine, 'before_cursor_execute', count_statement)
+        event.listen(bound_engine.sync_engine, 'commit', count_commit)
+
+    await clean_up()
+
+    app = create_app()
+
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url='http://budgets'
+        ) as client,
+    ):
+        flow = Flow(client)
+        auth_services.send_otp_email = flow.capture_otp  # type: ignore[assignment]
+
+        # The first pass fills compiled statement and prepared statement caches.
+        await flow.run('warmup')
+        await settle_file_cache()
+        await flow.run('measured')
+
+    await clean_up()
+    await engine.dispose()
+
+    failed = False
+    print(f'{"endpoint":<30} {"statements":>12} {"commits":>9} {"wall ms":>14}')
+
+    for name, budget in BUDGETS.items():
+        usage = flow.usages[name]
+        over = [
+            usage.statements > budget.statements,
+            usage.commits > budget.commits,
+            not args.skip_latency and usage.wall_ms > budget.wall_ms * args.latency_scale,
+        ]
+        failed |= any(over)
+
+        print(
+            f'{name:<30} {usage.statements:>5} / {budget.statements:<4}'
+            f' {usage.commits:>3} / {budget.commits:<3}'
+            f' {usage.wall_ms:>6.1f} / {budget.wall_ms * args.latency_scale:<5.0f}'
+            f' {"OVER BUDGET" if any(over) else "ok"}'
+        )
+
+    return int(failed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check per-endpoint SQL statement, commit and latency budgets.'
+    )
+    parser.add_argument(
+        '--latency-scale',
+        type=float,
+        default=1.0,
+        help='Multiply latency budgets, e.g. on slower CI machines.',
+    )
+    parser.add_argument('--skip-latency', action='store_true', help='Only check round trips.')
+    sys.exit(asyncio.run(main(parser.parse_args())))
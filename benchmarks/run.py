@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from pathlib import Path
+
+import httpx
+import orjson
+
+from src.database import engine, session_factory
+
+from .scenarios import SCENARIOS, Context, Scenario, UnexpectedStatusError
+from .seed import PASSWORD, seed
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Load-test the API and write results as JSON.')
+    parser.add_argument(
+        '--url', help='Benchmark an already running server instead of starting one.'
+    )
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument(
+        '--server',
+        choices=['uvicorn', 'serve'],
+        default='serve',
+        help='uvicorn runs the plain uvicorn CLI, serve runs python -m src.serve.',
+    )
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per scenario.')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--heavy-user-files', type=int, default=10_000)
+    parser.add_argument('--upload-concurrency', type=int, default=4)
+    parser.add_argument('--upload-size-mb', type=int, default=100)
+    parser.add_argument('--public-files', type=int, default=10)
+    parser.add_argument('--public-file-size-kb', type=int, default=1024)
+    parser.add_argument(
+        '--shape-transfers',
+        action='store_true',
+        help='Keep per-user and anonymous bandwidth limits on, which caps download and upload.',
+    )
+    parser.add_argument('--output', type=Path)
+    parser.add_argument('--compare', type=Path, help='Previous results file to compare against.')
+
+    return parser.parse_args()
+
+
+@contextmanager
+def server(args: argparse.Namespace) -> Iterator[str]:
+    if args.url:
+        yield args.url
+        return
+
+    if args.server == 'serve':
+        command = [sys.executable, '-m', 'src.serve']
+    else:
+        # The command compose used before src.serve existed.
+        command = [
+            sys.executable, '-m', 'uvicorn', '--factory', 'src.main:create_app',
+            '--host', '127.0.0.1', '--port', str(args.port), '--workers', str(args.workers),
+            '--no-server-header', '--no-date-header', '--no-use-colors', '--no-access-log',
+        ]  # fmt: skip
+
+    process = subprocess.Popen(
+        command,
+        env={
+            **os.environ,
+            'APP_ENVIRONMENT': 'production',
+            'API_HOST': '127.0.0.1',
+            'API_PORT': str(args.port),
+            'API_WORKERS_COUNT': str(args.workers),
+            'FILES_TRANSFER_SHAPING': str(args.shape_transfers).lower(),
+        },
+    )
+    url = f'http://127.0.0.1:{args.port}'
+
+    try:
+        wait_until_up(url)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def wait_until_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{url}/ready', timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+
+        time.sleep(0.2)
+
+    raise RuntimeError(f'Server at {url} did not start in {timeout} seconds.')
+
+
+def percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_scenario(
+    scenario: Scenario,
+    client: httpx.AsyncClient,
+    ctx: Context,
+    concurrency: int,
+    duration: float,
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int) -> None:
+        nonlocal errors
+
+        while time.perf_counter() < deadline:
+            try:
+                latencies.append(await scenario(client, ctx, index))
+            except (httpx.HTTPError, UnexpectedStatusError):
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'concurrency': concurrency,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+    }
+
+
+async def sign_in_all(client: httpx.AsyncClient, names: list[str], ctx: Context) -> None:
+    for name in names:
+        response = await client.post('/auth/sign_in', json={'name': name, 'password': PASSWORD})
+        response.raise_for_status()
+        ctx.access_tokens[name] = response.json()['access_token']
+        ctx.refresh_tokens[name] = response.json()['refresh_token']
+
+
+def write_upload_file(size_mb: int) -> Path:
+    with tempfile.NamedTemporaryFile(prefix='bench-upload-', delete=False) as upload_file:
+        for _ in range(size_mb):
+            upload_file.write(os.urandom(1024 * 1024))
+
+    return Path(upload_file.name)
+
+
+def compare(results: dict, previous_path: Path) -> None:
+    previous = orjson.loads(previous_path.read_bytes())['scenarios']
+
+    print(f'{"scenario":<12} {"rps":>10} {"prev rps":>10} {"p99 ms":>10} {"prev p99":>10}')
+    for name, stats in results['scenarios'].items():
+        old = previous.get(name, {})
+        print(
+            f'{name:<12} {stats.get("throughput_rps", 0):>10} {old.get("throughput_rps", "-"):>10} '
+            f'{stats.get("p99_ms", 0):>10} {old.get("p99_ms", "-"):>10}'
+        )
+
+
+async def main(args: argparse.Namespace) -> dict:
+    async with session_factory() as session:
+        seed_result = await seed(
+            session,
+            users=max(args.users, args.concurrency),
+            heavy_user_files=args.heavy_user_files,
+            upload_users=args.upload_concurrency,
+            public_files=args.public_files,
+            public_file_size=args.public_file_size_kb * 1024,
+        )
+
+    upload_path = write_upload_file(args.upload_size_mb) if 'upload' in args.scenarios else Path()
+    ctx = Context(seed=seed_result, upload_path=upload_path)
+    results: dict = {
+        'started_at': datetime.now(UTC).isoformat(),
+        'config': {key: str(value) for key, value in vars(args).items()},
+        'scenarios': {},
+    }
+
+    try:
+        with server(args) as url:
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300) as client:
+                await sign_in_all(
+                    client,
+                    [
+                        seed_result.heavy_user_name,
+                        *seed_result.upload_user_names,
+                        *seed_result.user_names[: args.concurrency],
+                    ],
+                    ctx,
+                )
+
+                for name in args.scenarios:
+                    concurrency = args.upload_concurrency if name == 'upload' else args.concurrency
+                    stats = await run_scenario(
+                        SCENARIOS[name],
+                        client,
+                        ctx,
+                        concurrency,
+                        args.duration,
+                    )
+                    results['scenarios'][name] = stats
+                    print(name, stats)
+    finally:
+        if upload_path.name:
+            upload_path.unlink(missing_ok=True)
+
+        await engine.dispose()
+
+    return results
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = asyncio.run(main(args))
+
+    output = args.output or Path('benchmarks/results') / f'{datetime.now(UTC):%Y%m%dT%H%M%S}.json'
+    output.write_bytes(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+    print(f'Results written to {output}')
+
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,126 @@
+import random
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+from sqlalchemy import delete, select, update
+
+from src.database import session_factory
+from src.models import File as FileModel
+from src.models import User as UserModel
+
+from .seed import PASSWORD, SeedResult
+
+
+class UnexpectedStatusError(Exception):
+    pass
+
+
+@dataclass
+class Context:
+    seed: SeedResult
+    upload_path: Path
+    access_tokens: dict[str, str] = field(default_factory=dict)
+    refresh_tokens: dict[str, str] = field(default_factory=dict)
+
+
+type Scenario = Callable[[httpx.AsyncClient, Context, int], Awaitable[float]]
+
+
+def check(response: httpx.Response, expected: int) -> None:
+    if response.status_code != expected:
+        raise UnexpectedStatusError(f'{response.request.url}: {response.status_code}')
+
+
+async def sign_in(client: httpx.AsyncClient, ctx: Context, _worker: int) -> float:
+    name = random.choice(ctx.seed.user_names)
+
+    start = time.perf_counter()
+    response = await client.post('/auth/sign_in', json={'name': name, 'password': PASSWORD})
+    elapsed = time.perf_counter() - start
+
+    check(response, 200)
+    return elapsed
+
+
+async def refresh(client: httpx.AsyncClient, ctx: Context, worker: int) -> float:
+    name = ctx.seed.user_names[worker]
+    headers = {'Authorization': f'Bearer {ctx.refresh_tokens[name]}'}
+
+    start = time.perf_counter()
+    response = await client.post('/auth/refresh', headers=headers)
+    elapsed = time.perf_counter() - start
+
+    check(response, 200)
+    ctx.refresh_tokens[name] = response.json()['refresh_token']
+    return elapsed
+
+
+async def list_files(client: httpx.AsyncClient, ctx: Context, _worker: int) -> float:
+    headers = {'Authorization': f'Bearer {ctx.access_tokens[ctx.seed.heavy_user_name]}'}
+
+    start = time.perf_counter()
+    response = await client.get('/files', headers=headers)
+    elapsed = time.perf_counter() - start
+
+    check(response, 200)
+    return elapsed
+
+
+async def upload(client: httpx.AsyncClient, ctx: Context, worker: int) -> float:
+    name = ctx.seed.upload_user_names[worker]
+    headers = {'Authorization': f'Bearer {ctx.access_tokens[name]}'}
+
+    with ctx.upload_path.open('rb') as upload_file:
+        start = time.perf_counter()
+        response = await client.post(
+            '/files',
+            headers=headers,
+            files={'file': ('bench.bin', upload_file, 'application/octet-stream')},
+        )
+        elapsed = time.perf_counter() - start
+
+    check(response, 201)
+    await release_upload_user(name)
+    return elapsed
+
+
+async def release_upload_user(name: str) -> None:
+    async with session_factory() as session:
+        user_id = select(UserModel.id).where(UserModel.name == name).scalar_subquery()
+        stmt = (
+            delete(FileModel).where(FileModel.user_id == user_id).returning(FileModel.stored_name)
+        )
+        result = await session.execute(stmt)
+
+        for stored_name in result.scalars():
+            (Path('storage') / stored_name).unlink(missing_ok=True)
+
+        await session.execute(
+            update(UserModel).where(UserModel.name == name).values(used_storage=0)
+        )
+        await session.commit()
+
+
+async def download(client: httpx.AsyncClient, ctx: Context, _worker: int) -> float:
+    file_id = random.choice(ctx.seed.public_file_ids)
+
+    start = time.perf_counter()
+    async with client.stream('GET', f'/files/{file_id}/download') as response:
+        async for _ in response.aiter_raw():
+            pass
+    elapsed = time.perf_counter() - start
+
+    check(response, 200)
+    return elapsed
+
+
+SCENARIOS: dict[str, Scenario] = {
+    'sign_in': sign_in,
+    'refresh': refresh,
+    'list_files': list_files,
+    'upload': upload,
+    'download': download,
+}
@@ -0,0 +1,113 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import uuid4
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.api.auth.dependencies import hash_password
+from src.enums import FileVisibility, UserSubscribePlan
+from src.models import File as FileModel
+from src.models import RefreshToken as RefreshTokenModel
+from src.models import User as UserModel
+
+
+USER_PREFIX = 'bench_'
+PASSWORD = 'bench-password'
+
+
+@dataclass
+class SeedResult:
+    user_names: list[str]
+    heavy_user_name: str
+    upload_user_names: list[str]
+    public_file_ids: list[int]
+
+
+async def clean(session: AsyncSession) -> None:
+    user_ids = select(UserModel.id).where(UserModel.name.startswith(USER_PREFIX))
+    stored_names = await session.execute(
+        select(FileModel.stored_name).where(FileModel.user_id.in_(user_ids))
+    )
+
+    for stored_name in stored_names.scalars():
+        (Path('storage') / stored_name).unlink(missing_ok=True)
+
+    await session.execute(delete(FileModel).where(FileModel.user_id.in_(user_ids)))
+    await session.execute(delete(RefreshTokenModel).where(RefreshTokenModel.user_id.in_(user_ids)))
+    await session.execute(delete(UserModel).where(UserModel.name.startswith(USER_PREFIX)))
+    await session.commit()
+
+
+async def seed(
+    session: AsyncSession,
+    users: int,
+    heavy_user_files: int,
+    upload_users: int,
+    public_files: int,
+    public_file_size: int,
+) -> SeedResult:
+    await clean(session)
+
+    password_hash = hash_password(PASSWORD)
+    user_names = [f'{USER_PREFIX}{i:06d}' for i in range(users)]
+    heavy_user_name = f'{USER_PREFIX}heavy'
+    upload_user_names = [f'{USER_PREFIX}upload_{i:03d}' for i in range(upload_users)]
+
+    rows = [
+        {
+            'name': name,
+            'email': f'{name}@bench.local',
+            'password_hash': password_hash,
+            'subscribe_plan': UserSubscribePlan.PRO,
+        }
+        for name in [*user_names, heavy_user_name, *upload_user_names]
+    ]
+    await session.execute(insert(UserModel), rows)
+
+    result = await session.execute(select(UserModel.id).where(UserModel.name == heavy_user_name))
+    heavy_user_id = result.scalar_one()
+
+    for offset in range(0, heavy_user_files, 5000):
+        batch = [
+            {
+                'user_id': heavy_user_id,
+                'name': f'document-{i}.pdf',
+                'stored_name': uuid4().hex,
+                'size': 1024 * 1024,
+                'content_type': 'application/pdf',
+            }
+            for i in range(offset, min(offset + 5000, heavy_user_files))
+        ]
+        await session.execute(insert(FileModel), batch)
+
+    public_file_ids = []
+
+    for i in range(public_files):
+        stored_name = uuid4().hex
+        (Path('storage') / stored_name).write_bytes(os.urandom(public_file_size))
+
+        stmt = (
+            insert(FileModel)
+            .values(
+                user_id=heavy_user_id,
+                name=f'public-{i}.bin',
+                stored_name=stored_name,
+                size=public_file_size,
+                content_type='application/octet-stream',
+                visibility=FileVisibility.PUBLIC,
+            )
+            .returning(FileModel.id)
+        )
+        result = await session.execute(stmt)
+        public_file_ids.append(result.scalar_one())
+
+    await session.commit()
+
+    return SeedResult(
+        user_names=user_names,
+        heavy_user_name=heavy_user_name,
+        upload_user_names=upload_user_names,
+        public_file_ids=public_file_ids,
+    )
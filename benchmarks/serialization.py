@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from src.api.files import services
+from src.database import engine, session_factory
+from src.models import File as FileModel
+from src.models import User as UserModel
+from src.responses import rows_response
+from src.schemas.files import FileOut as FileOutSchema
+
+from .seed import seed
+
+
+FILE_OUT_LIST = TypeAdapter(list[FileOutSchema])
+
+
+async def orm_and_pydantic(user_id: int) -> bytes:
+    async with session_factory() as session:
+        stmt = (
+            select(FileModel)
+            .where(FileModel.user_id == user_id)
+            .order_by(FileModel.created_at.desc())
+        )
+        files = (await session.execute(stmt)).scalars().all()
+
+    validated = FILE_OUT_LIST.validate_python(files, from_attributes=True)
+    return ORJSONResponse(FILE_OUT_LIST.dump_python(validated, mode='json')).body
+
+
+async def core_rows(user_id: int) -> bytes:
+    async with session_factory() as session:
+        rows = await services.get_files(session, user_id)
+
+    return rows_response(rows).body
+
+
+async def measure(path: Callable[[int], Awaitable[bytes]], user_id: int, repeat: int) -> dict:
+    await path(user_id)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    for _ in range(repeat):
+        body = await path(user_id)
+
+    return {
+        'cpu_ms_per_listing': round((time.process_time() - cpu_start) / repeat * 1000, 2),
+        'wall_ms_per_listing': round((time.perf_counter() - wall_start) / repeat * 1000, 2),
+        'body_bytes': len(body),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with session_factory() as session:
+        seed_result = await seed(
+            session,
+            users=0,
+            heavy_user_files=args.files,
+            upload_users=0,
+            public_files=0,
+            public_file_size=0,
+        )
+        stmt = select(UserModel.id).where(UserModel.name == seed_result.heavy_user_name)
+        user_id = (await session.execute(stmt)).scalar_one()
+
+    for name, path in [('orm_and_pydantic', orm_and_pydantic), ('core_rows', core_rows)]:
+        print(name, await measure(path, user_id, args.repeat))
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare CPU cost of GET /files serialization.')
+    parser.add_argument('--files', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
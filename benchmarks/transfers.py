@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from uuid import uuid4
+
+import httpx
+import orjson
+from sqlalchemy import event, insert, update
+
+from src.api.auth.dependencies import create_access_token
+from src.database import engine, session_factory
+from src.enums import UserSubscribePlan
+from src.main import create_app
+from src.models import File as FileModel
+from src.models import User as UserModel
+from src.settings import files_settings
+
+from .seed import clean, seed
+
+
+type Transfer = Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]
+
+
+class PoolHolds:
+    def __init__(self) -> None:
+        self.checked_out: dict[int, float] = {}
+        self.longest = 0.0
+
+    def on_checkout(self, dbapi_connection: object, *_: object) -> None:
+        self.checked_out[id(dbapi_connection)] = time.perf_counter()
+
+    def on_checkin(self, dbapi_connection: object, *_: object) -> None:
+        start = self.checked_out.pop(id(dbapi_connection), None)
+
+        if start is not None:
+            self.longest = max(self.longest, time.perf_counter() - start)
+
+
+async def prepare(args: argparse.Namespace) -> Transfer:
+    payload = os.urandom(args.size_kb * 1024)
+
+    async with session_factory() as session:
+        seed_result = await seed(
+            session,
+            users=0,
+            heavy_user_files=0,
+            upload_users=1,
+            public_files=1,
+            public_file_size=len(payload),
+        )
+
+        # Basic has the fewest upload slots, so most uploads queue for one.
+        stmt = (
+            update(UserModel)
+            .where(UserModel.name == seed_result.upload_user_names[0])
+            .values(subscribe_plan=UserSubscribePlan.BASIC)
+            .returning(UserModel.id)
+        )
+        user_id = (await session.execute(stmt)).scalar_one()
+
+        # Content updates replace each file with as many bytes, so no storage is reserved.
+        content_file_ids = []
+
+        for _ in range(args.transfers if args.transfer == 'content' else 0):
+            stored_name = uuid4().hex
+            (Path('storage') / stored_name).write_bytes(payload)
+
+            stmt = (
+                insert(FileModel)
+                .values(
+                    user_id=user_id,
+                    name='transfer.bin',
+                    stored_name=stored_name,
+                    size=len(payload),
+                    content_type='application/octet-stream',
+                )
+                .returning(FileModel.id)
+            )
+            content_file_ids.append((await session.execute(stmt)).scalar_one())
+
+        await session.commit()
+
+    file_id = seed_result.public_file_ids[0]
+    headers = {'Authorization': f'Bearer {create_access_token(user_id)}'}
+
+    async def download(client: httpx.AsyncClient) -> httpx.Response:
+        return await client.get(f'/files/{file_id}/download')
+
+    async def upload(client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post(
+            '/files', files={'file': ('transfer.bin', payload)}, headers=headers
+        )
+
+    delta = orjson.dumps({'block_size': 1024, 'ops': [{'data': len(payload)}]}).decode()
+    content_file_id = iter(content_file_ids)
+
+    async def content(client: httpx.AsyncClient) -> httpx.Response:
+        return await client.put(
+            f'/files/{next(content_file_id)}/content',
+            data={'delta': delta},
+            files={'data': ('transfer.bin', payload)},
+            headers=headers,
+        )
+
+    return {'download': download, 'upload': upload, 'content': content}[args.transfer]
+
+
+async def main(args: argparse.Namespace) -> int:
+    transfer = await prepare(args)
+    app = create_app()
+    holds = PoolHolds()
+
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url='http://transfers', timeout=None
+        ) as client,
+    ):
+        event.listen(engine.sync_engine.pool, 'checkout', holds.on_checkout)
+        event.listen(engine.sync_engine.pool, 'checkin', holds.on_checkin)
+
+        # Transfers from one client share its bandwidth and transfer slots,
+        # so most of them spend their time throttled or queued for a slot.
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(transfer(client) for _ in range(args.transfers)))
+        elapsed = time.perf_counter() - start
+
+        event.remove(engine.sync_engine.pool, 'checkout', holds.on_checkout)
+        event.remove(engine.sync_engine.pool, 'checkin', holds.on_checkin)
+
+    async with session_factory() as session:
+        await clean(session)
+
+    await engine.dispose()
+
+    statuses = sorted({response.status_code for response in responses})
+    print(
+        f'{args.transfers} {args.transfer} transfers of {args.size_kb} KiB in {elapsed:.1f}s, '
+        f'slot timeout {files_settings.transfer_slot_timeout_seconds}s, statuses {statuses}'
+    )
+    print(f'longest connection checkout {holds.longest * 1000:.0f} ms')
+
+    return int(holds.longest * 1000 > args.max_hold_ms or max(statuses) >= 300)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check that throttled transfers do not hold database connections.'
+    )
+    parser.add_argument('--transfer', choices=['download', 'upload', 'content'], default='download')
+    parser.add_argument('--transfers', type=int, default=8)
+    parser.add_argument('--size-kb', type=int, default=1024)
+    parser.add_argument(
+        '--max-hold-ms',
+        type=float,
+        default=250,
+        help='Longest a request may keep a pooled connection while its transfer is shaped.',
+    )
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import BinaryIO
+from uuid import uuid4
+
+import aiofiles
+
+from src.api.files.writer import UploadWriter
+
+
+async def no_throttle(_: int) -> None:
+    pass
+
+
+async def write_with_aiofiles(source: BinaryIO, path: Path, chunk_size: int) -> None:
+    async with aiofiles.open(path, 'wb') as out_file:
+        while content := await asyncio.to_thread(source.read, chunk_size):
+            await out_file.write(content)
+
+
+async def upload(
+    writer: UploadWriter | None,
+    directory: Path,
+    payload: bytes,
+    chunk_size: int,
+) -> None:
+    path = directory / uuid4().hex
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as source:
+        source.write(payload)
+        source.seek(0)
+
+        if writer is None:
+            await write_with_aiofiles(source, path, chunk_size)  # type: ignore[arg-type]
+        else:
+            await writer.write(source, path, len(payload), no_throttle)  # type: ignore[arg-type]
+
+
+async def measure(
+    writer: UploadWriter | None,
+    directory: Path,
+    payload: bytes,
+    chunk_size: int,
+    uploads: int,
+    concurrency: int,
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited() -> None:
+        async with semaphore:
+            await upload(writer, directory, payload, chunk_size)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited() for _ in range(uploads)))
+    elapsed = time.perf_counter() - start
+
+    for path in directory.iterdir():
+        path.unlink()
+
+    return {
+        'uploads_per_second': round(uploads / elapsed, 1),
+        'mb_per_second': round(uploads * len(payload) / elapsed / 2**20, 1),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    payload = os.urandom(args.size)
+    directory = Path(tempfile.mkdtemp(prefix='upload-bench-', dir=args.dir))
+
+    try:
+        for concurrency in args.concurrency:
+            print(f'concurrency {concurrency}')
+            result = await measure(
+                None, directory, payload, args.chunk_size, args.uploads, concurrency
+            )
+            print(f'  {"aiofiles":<10}', result)
+
+            for durability in ('none', 'fdatasync', 'group'):
+                writer = UploadWriter(
+                    args.io_threads,
+                    args.chunk_size,
+                    durability,
+                    args.group_commit_window_ms / 1000,
+                )
+                result = await measure(
+                    writer, directory, payload, args.chunk_size, args.uploads, concurrency
+                )
+                writer.executor.shutdown()
+                print(f'  {durability:<10}', result)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare upload write throughput for each durability mode.'
+    )
+    parser.add_argument('--dir', default='storage', help='Directory on the storage filesystem.')
+    parser.add_argument('--size', type=int, default=4 * 1024 * 1024, help='Bytes per upload.')
+    parser.add_argument('--uploads', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--chunk-size', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--io-threads', type=int, default=8)
+    parser.add_argument('--group-commit-window-ms', type=float, default=0)
+    asyncio.run(main(parser.parse_args()))
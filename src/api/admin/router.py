@@ -0,0 +1,74 @@
+from datetime import date
+
+from fastapi import APIRouter, Query
+
+from src.api.files.export import ExportFormat, export_response
+from src.dependencies import current_admin_dep, read_session_dep, written_at_dep
+from src.enums import UserSubscribePlan
+from src.responses import rows_response
+from src.schemas.admin import ContentTypeStorage as ContentTypeStorageSchema
+from src.schemas.admin import DailyStorage as DailyStorageSchema
+from src.schemas.admin import PlanStorage as PlanStorageSchema
+
+from . import services
+
+
+router = APIRouter()
+
+
+@router.get(
+    '/storage/plans',
+    response_model=list[PlanStorageSchema],
+)
+async def get_storage_by_plan(
+    _: current_admin_dep,
+    session: read_session_dep,
+):
+    result = await services.get_storage_by_plan(session)
+
+    return rows_response(result)
+
+
+@router.get(
+    '/storage/content-types',
+    response_model=list[ContentTypeStorageSchema],
+)
+async def get_storage_by_content_type(
+    _: current_admin_dep,
+    session: read_session_dep,
+):
+    result = await services.get_storage_by_content_type(session)
+
+    return rows_response(result)
+
+
+@router.get(
+    '/storage/daily',
+    response_model=list[DailyStorageSchema],
+)
+async def get_daily_storage(
+    _: current_admin_dep,
+    session: read_session_dep,
+    start: date | None = None,
+    end: date | None = None,
+    subscribe_plan: UserSubscribePlan | None = None,
+    content_type: str | None = None,
+):
+    result = await services.get_daily_storage(
+        session,
+        start,
+        end,
+        subscribe_plan,
+        content_type,
+    )
+
+    return rows_response(result)
+
+
+@router.get('/files/export')
+async def export_files(
+    _: current_admin_dep,
+    written_at: written_at_dep,
+    export_format: ExportFormat = Query('ndjson', alias='format'),
+):
+    return export_response(None, written_at, export_format)
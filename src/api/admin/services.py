@@ -0,0 +1,85 @@
+from collections.abc import Sequence
+from datetime import date
+
+from sqlalchemy import BigInteger, ColumnElement, Row, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.enums import UserSubscribePlan
+from src.models import StorageUsageRollup as StorageUsageRollupModel
+
+
+def total(column: ColumnElement[int]) -> ColumnElement[int]:
+    return cast(func.coalesce(func.sum(column), 0), BigInteger)
+
+
+live_files = total(StorageUsageRollupModel.files_added - StorageUsageRollupModel.files_removed)
+live_bytes = total(StorageUsageRollupModel.bytes_added - StorageUsageRollupModel.bytes_removed)
+
+
+async def get_storage_by_plan(session: AsyncSession) -> Sequence[Row]:
+    stmt = (
+        select(
+            StorageUsageRollupModel.subscribe_plan,
+            live_files.label('files'),
+            live_bytes.label('bytes'),
+        )
+        .group_by(StorageUsageRollupModel.subscribe_plan)
+        .order_by(StorageUsageRollupModel.subscribe_plan)
+    )
+    result = await session.execute(stmt)
+    result = result.all()
+
+    return result
+
+
+async def get_storage_by_content_type(session: AsyncSession) -> Sequence[Row]:
+    stmt = (
+        select(
+            StorageUsageRollupModel.content_type,
+            live_files.label('files'),
+            live_bytes.label('bytes'),
+        )
+        .group_by(StorageUsageRollupModel.content_type)
+        .order_by(live_bytes.desc())
+    )
+    result = await session.execute(stmt)
+    result = result.all()
+
+    return result
+
+
+async def get_daily_storage(
+    session: AsyncSession,
+    start: date | None,
+    end: date | None,
+    subscribe_plan: UserSubscribePlan | None,
+    content_type: str | None,
+) -> Sequence[Row]:
+    stmt = (
+        select(
+            StorageUsageRollupModel.day,
+            total(StorageUsageRollupModel.files_added).label('files_added'),
+            total(StorageUsageRollupModel.bytes_added).label('bytes_added'),
+            total(StorageUsageRollupModel.files_removed).label('files_removed'),
+            total(StorageUsageRollupModel.bytes_removed).label('bytes_removed'),
+        )
+        .group_by(StorageUsageRollupModel.day)
+        .order_by(StorageUsageRollupModel.day)
+    )
+
+    if start is not None:
+        stmt = stmt.where(StorageUsageRollupModel.day >= start)
+
+    if end is not None:
+        stmt = stmt.where(StorageUsageRollupModel.day <= end)
+
+    if subscribe_plan is not None:
+        stmt = stmt.where(StorageUsageRollupModel.subscribe_plan == subscribe_plan)
+
+    if content_type is not None:
+        stmt = stmt.where(StorageUsageRollupModel.content_type == content_type)
+
+    result = await session.execute(stmt)
+    result = result.all()
+
+    return result
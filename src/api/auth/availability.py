@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import logging
+import math
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import func, select
+
+from src.database import session_factory
+from src.models import User as UserModel
+from src.rate_limit import RateLimiter
+from src.settings import auth_settings, db_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, value: str) -> Iterator[int]:
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8])
+        second = int.from_bytes(digest[8:]) | 1
+
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, value: str) -> None:
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value)
+        )
+
+
+class AvailabilityFilter:
+    def __init__(self) -> None:
+        self.bloom: BloomFilter | None = None
+        self.watermark: datetime | None = None
+
+    def add(self, name: str, email: str) -> None:
+        if self.bloom is not None:
+            self.bloom.add(f'name:{name}')
+            self.bloom.add(f'email:{email}')
+
+    def might_be_taken(self, field: str, value: str) -> bool:
+        # Before the first build every value is a possible hit, so the database decides.
+        return self.bloom is None or f'{field}:{value}' in self.bloom
+
+    async def load(self, bloom: BloomFilter, since: datetime | None) -> datetime | None:
+        stmt = (
+            select(UserModel.name, UserModel.email, UserModel.created_at)
+            .order_by(UserModel.id)
+            .execution_options(yield_per=10_000)
+        )
+
+        if since is not None:
+            stmt = stmt.where(UserModel.created_at >= since)
+
+        watermark = since
+
+        async with session_factory() as session:
+            result = await session.stream(stmt)
+
+            async for rows in result.partitions():
+                for row in rows:
+                    bloom.add(f'name:{row.name}')
+                    bloom.add(f'email:{row.email}')
+                    watermark = max(watermark or row.created_at, row.created_at)
+
+        return watermark
+
+    async def rebuild(self) -> None:
+        async with session_factory() as session:
+            count = await session.scalar(select(func.count()).select_from(UserModel))
+
+        bloom = BloomFilter(
+            max(auth_settings.availability_filter_capacity, 2 * (count or 0)),
+            auth_settings.availability_filter_error_rate,
+        )
+        self.watermark = await self.load(bloom, None)
+        self.bloom = bloom
+
+    async def refresh(self) -> None:
+        if self.bloom is None or self.watermark is None:
+            await self.rebuild()
+            return
+
+        # created_at is the transaction start, so rows can commit after a later watermark.
+        since = self.watermark - timedelta(seconds=db_settings.statement_timeout_ms / 1000 + 60)
+        self.watermark = max(self.watermark, await self.load(self.bloom, since) or since)
+
+    async def keep_fresh(self) -> None:
+        while True:
+            await asyncio.sleep(auth_settings.availability_refresh_seconds)
+
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception('Failed to refresh the availability filter.')
+
+
+availability_filter = AvailabilityFilter()
+
+availability_limiter = RateLimiter(
+    auth_settings.availability_rate_per_second,
+    auth_settings.availability_burst,
+)
+
+
+async def limit_availability_checks(request: Request) -> None:
+    retry_after = availability_limiter.check(request.client.host if request.client else 'unknown')
+
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Too many availability checks.',
+            headers={'Retry-After': str(math.ceil(retry_after))},
+        )
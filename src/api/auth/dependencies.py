@@ -1,20 +1,32 @@
+import functools
 import hashlib
 import secrets
-from collections.abc import Callable, Coroutine
+import time
+from collections.abc import AsyncGenerator, Callable, Coroutine
 from datetime import UTC, datetime, timedelta
 from email.message import EmailMessage
 from email.utils import formatdate, make_msgid
-from typing import Annotated, Any, Literal, TypedDict
+from typing import Annotated, Any, Literal, NotRequired, TypedDict
 
 import aiosmtplib
 import jwt
 from argon2 import PasswordHasher
-from fastapi import Depends, HTTPException, status
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey, RSAPublicKey
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy import delete, select
+from sqlalchemy import delete, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database import get_session
+from src.database import (
+    WRITTEN_AT_COOKIE,
+    WRITTEN_AT_HEADER,
+    get_session,
+    parse_written_at,
+    replica_router,
+)
+from src.enums import UserScope
+from src.metrics import FUNCTION_DURATION, timed
 from src.models import RefreshToken as RefreshTokenModel
 from src.models import User as UserModel
 from src.settings import auth_settings, smtp_settings
@@ -31,12 +43,16 @@ class JWTPayload(TypedDict):
     type: Literal['access', 'refresh']
     user_id: int
     expires_at: int
+    jti: str
+    written_at: NotRequired[float]
 
 
+@timed('hash_password', 'hash')
 def hash_password(plain_password: str) -> str:
     return PASSWORD_HASHER.hash(plain_password)
 
 
+@timed('verify_password', 'hash')
 def verify_password(plain_password: str, stored_hash: str) -> bool:
     try:
         return PASSWORD_HASHER.verify(
@@ -48,8 +64,10 @@ def verify_password(plain_password: str, stored_hash: str) -> bool:
 
 
 def create_access_token(user_id: int) -> str:
+    # Tokens are issued right after a commit, so reads with them wait for replicas to catch up.
     payload = {
         'user_id': user_id,
+        'written_at': time.time(),
     }
 
     return create_jwt(
@@ -59,12 +77,10 @@ def create_access_token(user_id: int) -> str:
     )
 
 
-async def create_refresh_token(
+async def add_refresh_token(
     user_id: int,
     session: AsyncSession,
 ) -> str:
-    from sqlalchemy import insert
-
     payload = {
         'user_id': user_id,
     }
@@ -81,6 +97,15 @@ async def create_refresh_token(
         token_hash=token_hash,
     )
     await session.execute(stmt)
+
+    return token
+
+
+async def create_refresh_token(
+    user_id: int,
+    session: AsyncSession,
+) -> str:
+    token = await add_refresh_token(user_id, session)
     await session.commit()
 
     return token
@@ -96,26 +121,35 @@ def create_jwt(
         'type': token_type,
         **payload,
         'expires_at': int((now + expires_delta).timestamp()),
+        'jti': secrets.token_hex(8),
     }
 
     return encode_jwt(payload_copy)
 
 
-def encode_jwt(payload: dict) -> str:
-    with open('./certificates/jwt-private.pem', encoding='utf-8') as key_file:
-        private_key = key_file.read()
+@functools.cache
+def get_private_key() -> RSAPrivateKey:
+    with open('./certificates/jwt-private.pem', 'rb') as key_file:
+        return serialization.load_pem_private_key(key_file.read(), password=None)  # type: ignore[return-value]
 
-    return jwt.encode(payload, private_key, 'RS256')
 
+@functools.cache
+def get_public_key() -> RSAPublicKey:
+    with open('./certificates/jwt-public.pem', 'rb') as key_file:
+        return serialization.load_pem_public_key(key_file.read())  # type: ignore[return-value]
 
-def decode_jwt(token: str) -> JWTPayload | None:
-    with open('./certificates/jwt-public.pem', encoding='utf-8') as key_file:
-        public_key = key_file.read()
 
+@timed('encode_jwt', 'jwt')
+def encode_jwt(payload: dict) -> str:
+    return jwt.encode(payload, get_private_key(), 'RS256')
+
+
+@timed('decode_jwt', 'jwt')
+def decode_jwt(token: str) -> JWTPayload | None:
     try:
         data = jwt.decode(
             token,
-            public_key,
+            get_public_key(),
             ['RS256'],
         )
     except Exception:
@@ -127,13 +161,57 @@ def decode_jwt(token: str) -> JWTPayload | None:
 security = HTTPBearer(auto_error=False)
 
 
+async def get_token_payload(
+    credentials: Annotated[HTTPAuthorizationCredentials | None, Depends(security)],
+) -> JWTPayload | None:
+    if not credentials or credentials.scheme != 'Bearer':
+        return None
+
+    return decode_jwt(credentials.credentials)
+
+
+async def get_written_at(
+    request: Request,
+    jwt_payload: Annotated[JWTPayload | None, Depends(get_token_payload)],
+    written_at_header: Annotated[
+        str | None,
+        Header(
+            alias=WRITTEN_AT_HEADER,
+            description=(
+                f'{WRITTEN_AT_HEADER} from the last response that changed data, for clients '
+                f'that do not keep the {WRITTEN_AT_COOKIE} cookie. Without either, reads may '
+                'be served by a replica that has not caught up with that change.'
+            ),
+        ),
+    ] = None,
+) -> float | None:
+    values = [
+        jwt_payload.get('written_at') if jwt_payload else None,
+        parse_written_at(request.cookies.get(WRITTEN_AT_COOKIE)),
+        parse_written_at(written_at_header),
+    ]
+
+    return max((value for value in values if value is not None), default=None)
+
+
+async def get_read_session(
+    session: Annotated[AsyncSession, Depends(get_session, scope='function')],
+    written_at: Annotated[float | None, Depends(get_written_at)],
+) -> AsyncGenerator[AsyncSession]:
+    async with replica_router.session(session, written_at) as read_session:
+        yield read_session
+
+
 def get_current_user_wrapper(
     token_type: str,
     required: bool,
 ) -> Callable[..., Coroutine[Any, Any, UserModel | None]]:
     async def get_current_user(
-        session: Annotated[AsyncSession, Depends(get_session)],
+        request: Request,
+        session: Annotated[AsyncSession, Depends(get_session, scope='function')],
+        written_at: Annotated[float | None, Depends(get_written_at)],
         credentials: Annotated[HTTPAuthorizationCredentials | None, Depends(security)],
+        jwt_payload: Annotated[JWTPayload | None, Depends(get_token_payload)],
     ) -> UserModel | None:
         if not credentials:
             if required:
@@ -150,8 +228,6 @@ def get_current_user_wrapper(
                 detail='Invalid authentication scheme.',
             )
 
-        jwt_payload = decode_jwt(credentials.credentials)
-
         if not jwt_payload:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -164,6 +240,8 @@ def get_current_user_wrapper(
                 detail='Invalid token type.',
             )
 
+        session.info['user_id'] = jwt_payload['user_id']
+
         if token_type == 'refresh':
             token_hash = hashlib.sha256(credentials.credentials.encode()).hexdigest()
             stmt = select(RefreshTokenModel).where(RefreshTokenModel.token_hash == token_hash)
@@ -187,8 +265,15 @@ def get_current_user_wrapper(
             )
 
         stmt = select(UserModel).where(UserModel.id == jwt_payload['user_id'])
-        result = await session.execute(stmt)
-        result = result.scalar_one_or_none()
+
+        # Writes stay on the primary; reads hold a replica connection just for this lookup.
+        if request.method in {'GET', 'HEAD'}:
+            async with replica_router.session(session, written_at) as read_session:
+                result = await read_session.execute(stmt)
+                result = result.scalar_one_or_none()
+        else:
+            result = await session.execute(stmt)
+            result = result.scalar_one_or_none()
 
         if not result:
             raise HTTPException(
@@ -201,6 +286,18 @@ def get_current_user_wrapper(
     return get_current_user
 
 
+async def get_current_admin(
+    user: Annotated[UserModel, Depends(get_current_user_wrapper('access', required=True))],
+) -> UserModel:
+    if user.scope != UserScope.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail='Admin access required.',
+        )
+
+    return user
+
+
 def generate_otp() -> str:
     return ''.join(secrets.choice('0123456789') for _ in range(6))
 
@@ -224,10 +321,11 @@ async def send_otp_email(to_email: str, otp: str) -> None:
     message['Date'] = formatdate()
     message.set_content(message_text)
 
-    async with aiosmtplib.SMTP(
-        hostname=smtp_settings.host,
-        port=smtp_settings.port,
-        username=smtp_settings.user,
-        password=smtp_settings.password,
-    ) as server:
-        await server.send_message(message)
+    with FUNCTION_DURATION.labels('send_otp_email').time():
+        async with aiosmtplib.SMTP(
+            hostname=smtp_settings.host,
+            port=smtp_settings.port,
+            username=smtp_settings.user,
+            password=smtp_settings.password,
+        ) as server:
+            await server.send_message(message)
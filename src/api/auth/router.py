@@ -1,8 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from fastapi.security import HTTPBearer
 from pydantic import EmailStr
 
-from src.dependencies import current_user_access_dep, current_user_refresh_dep, session_dep
+from src.dependencies import (
+    current_user_access_dep,
+    current_user_refresh_dep,
+    read_session_dep,
+    session_dep,
+)
+from src.responses import dump_json
+from src.schemas.auth import Availability as AvailabilitySchema
 from src.schemas.auth import SignIn as SignInSchema
 from src.schemas.auth import SignUp as SignUpSchema
 from src.schemas.auth import Token as TokenSchema
@@ -10,6 +17,7 @@ from src.schemas.auth import VerifyOTP as VerifyOTPSchema
 from src.schemas.users import UserProfile as UserProfileSchema
 
 from . import services
+from .availability import limit_availability_checks
 
 
 router = APIRouter()
@@ -26,6 +34,24 @@ async def sign_up(
     )
 
 
+@router.get(
+    '/availability',
+    dependencies=[Depends(limit_availability_checks)],
+)
+async def check_availability(
+    session: read_session_dep,
+    name: str | None = None,
+    email: EmailStr | None = None,
+) -> AvailabilitySchema:
+    result = await services.check_availability(
+        session,
+        name,
+        email,
+    )
+
+    return result  # type: ignore[return-value]
+
+
 @router.post('/verify_otp')
 async def verify_otp(
     session: session_dep,
@@ -79,8 +105,20 @@ async def refresh(
     return result  # type: ignore[return-value]
 
 
-@router.get('')
+@router.get(
+    '',
+    response_model=UserProfileSchema,
+)
 async def get_current_user(
     current_user: current_user_access_dep,
-) -> UserProfileSchema:
-    return current_user  # type: ignore[return-value]
+):
+    return dump_json(
+        {
+            'id': current_user.id,
+            'name': current_user.name,
+            'subscribe_plan': current_user.subscribe_plan,
+            'email': current_user.email,
+            'used_storage': current_user.used_storage,
+            'created_at': current_user.created_at,
+        }
+    )
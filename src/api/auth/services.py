@@ -1,10 +1,14 @@
 import hashlib
 from datetime import UTC, datetime, timedelta
+from typing import NoReturn
 
 from fastapi import HTTPException, status
-from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy import delete, exists, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.enums import UserScope, UserSubscribePlan
+from src.metrics import AVAILABILITY_CHECKS
 from src.models import PendingUser as PendingUserModel
 from src.models import User as UserModel
 from src.schemas.auth import SignIn as SignInSchema
@@ -12,7 +16,9 @@ from src.schemas.auth import SignUp as SignUpSchema
 from src.schemas.auth import VerifyOTP as VerifyOTPSchema
 from src.settings import auth_settings
 
+from .availability import availability_filter
 from .dependencies import (
+    add_refresh_token,
     create_access_token,
     create_refresh_token,
     generate_otp,
@@ -22,48 +28,104 @@ from .dependencies import (
 )
 
 
+def raise_unique_violation(error: IntegrityError) -> NoReturn:
+    if getattr(error.orig, 'sqlstate', None) != '23505':
+        raise error
+
+    constraint = getattr(error.orig.__cause__, 'constraint_name', None) or ''
+    conflict_field = 'email' if constraint.endswith('_email_key') else 'name'
+
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f'User with this {conflict_field} already exists.',
+    ) from None
+
+
+def raise_taken(name_taken: bool) -> NoReturn:
+    conflict_field = 'name' if name_taken else 'email'
+
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f'User with this {conflict_field} already exists.',
+    )
+
+
 async def sign_up(
     session: AsyncSession,
     data: SignUpSchema,
 ):
-    stmt = select(UserModel).where(
+    otp = generate_otp()
+    otp_hash = hashlib.sha256(otp.encode()).hexdigest()
+    expires_at = datetime.now(UTC) + timedelta(minutes=auth_settings.otp_expire_minutes)
+
+    taken = select(func.bool_or(UserModel.name == data.name).label('name_taken')).where(
         or_(
             UserModel.name == data.name,
             UserModel.email == data.email,
         )
     )
-    result = await session.execute(stmt)
-    result = result.scalar_one_or_none()
 
-    if result:
-        conflict_field = 'name' if result.name == data.name else 'email'
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f'User with this {conflict_field} already exists.',
-        )
+    # Reject known users before paying for the password hash. The filter has no false
+    # negatives for users it has loaded, so fresh names and emails skip this query.
+    if any(
+        availability_filter.might_be_taken(field, value)
+        for field, value in [('name', data.name), ('email', data.email)]
+    ):
+        name_taken = await session.scalar(taken)
 
-    # TODO: Спитатись в левесв про цей момент
-    stmt = delete(PendingUserModel).where(
-        or_(
-            PendingUserModel.name == data.name,
-            PendingUserModel.email == data.email,
+        if name_taken is not None:
+            raise_taken(name_taken)
+
+    # One statement: report a taken name/email, otherwise replace any pending sign-up for them.
+    # This still catches users the filter has not loaded yet.
+    existing = taken.cte('existing')
+    is_free = select(existing.c.name_taken).scalar_subquery().is_(None)
+    cleared = (
+        delete(PendingUserModel)
+        .where(
+            or_(
+                PendingUserModel.name == data.name,
+                PendingUserModel.email == data.email,
+            ),
+            is_free,
         )
+        .returning(PendingUserModel.id)
+        .cte('cleared')
+    )
+    inserted = (
+        insert(PendingUserModel)
+        .from_select(
+            ['name', 'email', 'password_hash', 'otp_hash', 'expires_at'],
+            select(
+                literal(data.name),
+                literal(data.email),
+                literal(hash_password(data.password)),
+                literal(otp_hash),
+                literal(expires_at, PendingUserModel.expires_at.type),
+            ).where(
+                is_free,
+                # Referencing cleared makes the DELETE finish before the INSERT checks uniqueness.
+                select(func.count()).select_from(cleared).scalar_subquery() >= 0,
+            ),
+        )
+        .returning(PendingUserModel.id)
+        .cte('inserted')
+    )
+    stmt = select(
+        select(existing.c.name_taken).scalar_subquery(),
+        select(inserted.c.id).scalar_subquery(),
     )
-    await session.execute(stmt)
 
-    otp = generate_otp()
-    otp_hash = hashlib.sha256(otp.encode()).hexdigest()
-    expires_at = datetime.now(UTC) + timedelta(minutes=auth_settings.otp_expire_minutes)
+    try:
+        result = await session.execute(stmt)
+        name_taken, pending_id = result.one()
+        await session.commit()
+    except IntegrityError as error:
+        await session.rollback()
+        raise_unique_violation(error)
 
-    stmt = insert(PendingUserModel).values(
-        name=data.name,
-        email=data.email,
-        password_hash=hash_password(data.password),
-        otp_hash=otp_hash,
-        expires_at=expires_at,
-    )
-    await session.execute(stmt)
-    await session.commit()
+    if pending_id is None:
+        raise_taken(name_taken)
 
     await send_otp_email(data.email, otp)
 
@@ -72,52 +134,129 @@ async def verify_otp(
     session: AsyncSession,
     data: VerifyOTPSchema,
 ):
-    stmt = select(PendingUserModel).where(PendingUserModel.email == data.email)
-    result = await session.execute(stmt)
-    result = result.scalar_one_or_none()
+    otp_hash = hashlib.sha256(data.otp.encode()).hexdigest()
 
-    if not result:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='Registration not found. Please sign up again.',
+    claimed = (
+        delete(PendingUserModel)
+        .where(
+            PendingUserModel.email == data.email,
+            PendingUserModel.otp_hash == otp_hash,
+            PendingUserModel.expires_at >= func.now(),
+        )
+        .returning(
+            PendingUserModel.name,
+            PendingUserModel.email,
+            PendingUserModel.password_hash,
         )
+        .cte('claimed')
+    )
+    stmt = (
+        insert(UserModel)
+        .from_select(
+            ['name', 'email', 'password_hash', 'subscribe_plan', 'scope', 'used_storage'],
+            select(
+                claimed.c.name,
+                claimed.c.email,
+                claimed.c.password_hash,
+                literal(UserSubscribePlan.BASIC, UserModel.subscribe_plan.type),
+                literal(UserScope.USER, UserModel.scope.type),
+                literal(0),
+            ),
+            # Column defaults are spelled out above; include_defaults renders them as NULL here.
+            include_defaults=False,
+        )
+        .returning(UserModel.id, UserModel.name)
+    )
 
-    if datetime.now(UTC) > result.expires_at:
-        stmt = delete(PendingUserModel).where(PendingUserModel.id == result.id)
-        await session.execute(stmt)
-        await session.commit()
+    try:
+        result = await session.execute(stmt)
+        result = result.one_or_none()
+    except IntegrityError as error:
+        await session.rollback()
+        raise_unique_violation(error)
+
+    if result is None:
+        await session.rollback()
+        await reject_otp(session, data.email)
+
+    session.info['user_id'] = result.id
+    refresh_token = await add_refresh_token(result.id, session)
+    await session.commit()
+
+    availability_filter.add(result.name, data.email)
+
+    return {
+        'access_token': create_access_token(result.id),
+        'refresh_token': refresh_token,
+    }
+
+
+async def reject_otp(
+    session: AsyncSession,
+    email: str,
+) -> NoReturn:
+    stmt = (
+        delete(PendingUserModel)
+        .where(
+            PendingUserModel.email == email,
+            PendingUserModel.expires_at < func.now(),
+        )
+        .returning(PendingUserModel.id)
+    )
+    result = await session.execute(stmt)
+    result = result.scalar_one_or_none()
+    await session.commit()
+
+    if result is not None:
         raise HTTPException(
             status_code=status.HTTP_410_GONE,
             detail='OTP code expired. Sign up again.',
         )
 
-    otp_hash = hashlib.sha256(data.otp.encode()).hexdigest()
-    if otp_hash != result.otp_hash:
+    stmt = select(PendingUserModel.id).where(PendingUserModel.email == email)
+    result = await session.execute(stmt)
+    result = result.scalar_one_or_none()
+
+    if result is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail='Invalid OTP code.',
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Registration not found. Please sign up again.',
         )
 
-    stmt = (
-        insert(UserModel)
-        .values(
-            name=result.name,
-            email=result.email,
-            password_hash=result.password_hash,
-        )
-        .returning(UserModel.id)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail='Invalid OTP code.',
     )
-    result = await session.execute(stmt)
-    result = result.scalar_one()
 
-    stmt = delete(PendingUserModel).where(PendingUserModel.id == result)
-    await session.execute(stmt)
-    await session.commit()
 
-    return {
-        'access_token': create_access_token(result),
-        'refresh_token': await create_refresh_token(result, session),
-    }
+async def check_availability(
+    session: AsyncSession,
+    name: str | None,
+    email: str | None,
+) -> dict:
+    if name is None and email is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail='Pass a name, an email or both.',
+        )
+
+    result = {}
+
+    for field, column, value in [('name', UserModel.name, name), ('email', UserModel.email, email)]:
+        if value is None:
+            continue
+
+        if not availability_filter.might_be_taken(field, value):
+            AVAILABILITY_CHECKS.labels(field, 'filter').inc()
+            result[field] = True
+            continue
+
+        stmt = select(exists().where(column == value))
+        taken = await session.scalar(stmt)
+        AVAILABILITY_CHECKS.labels(field, 'taken' if taken else 'false_positive').inc()
+        result[field] = not taken
+
+    return result
 
 
 async def resend_otp(
@@ -163,9 +302,12 @@ async def sign_in(
             detail='User not found.',
         )
 
+    session.info['user_id'] = result.id
+    refresh_token = await create_refresh_token(result.id, session)
+
     return {
         'access_token': create_access_token(result.id),
-        'refresh_token': await create_refresh_token(result.id, session),
+        'refresh_token': refresh_token,
     }
 
 
@@ -173,7 +315,9 @@ async def refresh(
     session: AsyncSession,
     user_id: int,
 ) -> dict:
+    refresh_token = await create_refresh_token(user_id, session)
+
     return {
         'access_token': create_access_token(user_id),
-        'refresh_token': await create_refresh_token(user_id, session),
+        'refresh_token': refresh_token,
     }
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import asyncpg
+from sqlalchemy import ColumnElement, Row, func
+
+from src.metrics import FILE_CACHE_FLUSHES, FILE_CACHE_INVALIDATION_LAG, FILE_CACHE_LOOKUPS
+from src.settings import db_settings, files_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def file_changed(file_id: int) -> ColumnElement:
+    # Added to the RETURNING clause of a statement changing the file, so the notification
+    # costs no extra round trip and is only delivered if the transaction commits.
+    return func.pg_notify(files_settings.metadata_cache_channel, f'{file_id}:{time.time()}')
+
+
+class FileCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.listening = False
+        self.version = 0
+        self._rows: OrderedDict[int, Row] = OrderedDict()
+
+    def get(self, file_id: int) -> Row | None:
+        row = self._rows.get(file_id)
+
+        if row is None:
+            FILE_CACHE_LOOKUPS.labels('miss').inc()
+            return None
+
+        self._rows.move_to_end(file_id)
+        FILE_CACHE_LOOKUPS.labels('hit').inc()
+
+        return row
+
+    def put(self, row: Row, version: int) -> None:
+        # Without a listener evictions can be missed, and a changed version means an
+        # invalidation arrived while row was being read, so it may already be stale.
+        if not self.listening or version != self.version:
+            return
+
+        self._rows[row.id] = row
+        self._rows.move_to_end(row.id)
+
+        if len(self._rows) > self.max_size:
+            self._rows.popitem(last=False)
+
+    def invalidate(self, file_id: int) -> None:
+        self.version += 1
+        self._rows.pop(file_id, None)
+
+    def flush(self) -> None:
+        self.version += 1
+        self._rows.clear()
+        FILE_CACHE_FLUSHES.inc()
+
+    def on_notification(self, _connection: object, _pid: int, _channel: str, payload: str) -> None:
+        file_id, _, sent_at = payload.partition(':')
+        self.invalidate(int(file_id))
+        FILE_CACHE_INVALIDATION_LAG.observe(max(time.time() - float(sent_at), 0))
+
+    def on_connection_lost(self, _connection: object) -> None:
+        self.listening = False
+        self.flush()
+
+    async def listen(self) -> None:
+        while True:
+            try:
+                connection = await asyncpg.connect(
+                    f'postgresql://{db_settings.user}:{db_settings.password}'
+                    f'@{db_settings.host}/{db_settings.name}'
+                )
+            except (OSError, TimeoutError, asyncpg.PostgresError):
+                logger.warning('File cache listener could not connect, retrying.')
+                await asyncio.sleep(files_settings.metadata_cache_reconnect_seconds)
+                continue
+
+            try:
+                connection.add_termination_listener(self.on_connection_lost)
+                await connection.add_listener(
+                    files_settings.metadata_cache_channel,
+                    self.on_notification,
+                )
+                # Changes made while nobody was listening were never seen.
+                self.flush()
+                self.listening = True
+
+                while True:
+                    await asyncio.sleep(files_settings.metadata_cache_health_check_seconds)
+                    await asyncio.wait_for(
+                        connection.execute('SELECT 1'),
+                        files_settings.metadata_cache_health_check_seconds,
+                    )
+            except (OSError, TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                logger.warning('File cache listener lost its connection, reconnecting.')
+            finally:
+                connection.remove_termination_listener(self.on_connection_lost)
+                connection.terminate()
+                self.listening = False
+                self.flush()
+
+            await asyncio.sleep(files_settings.metadata_cache_reconnect_seconds)
+
+
+file_cache = FileCache(files_settings.metadata_cache_size)
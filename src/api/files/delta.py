@@ -0,0 +1,101 @@
+import hashlib
+import zlib
+from collections.abc import Generator
+from pathlib import Path
+from typing import BinaryIO
+
+from src.schemas.files import DeltaCopy, FileDelta
+
+
+MIN_BLOCK_SIZE = 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+
+
+class InvalidDeltaError(ValueError):
+    pass
+
+
+# Weak sums are Adler-32, which a client can roll one byte at a time to find matching blocks.
+def compute_signatures(path: Path, block_size: int) -> list[dict[str, object]]:
+    blocks = []
+
+    with path.open('rb') as file:
+        while block := file.read(block_size):
+            blocks.append(
+                {
+                    'weak': zlib.adler32(block),
+                    'strong': hashlib.blake2b(block, digest_size=16).hexdigest(),
+                }
+            )
+
+    return blocks
+
+
+def delta_size(delta: FileDelta, base_size: int) -> int:
+    if not MIN_BLOCK_SIZE <= delta.block_size <= MAX_BLOCK_SIZE:
+        raise InvalidDeltaError('Unsupported block size.')
+
+    blocks_count = -(-base_size // delta.block_size)
+    size = 0
+
+    for op in delta.ops:
+        if isinstance(op, DeltaCopy):
+            end = op.copy_ + op.count
+
+            if end > blocks_count:
+                raise InvalidDeltaError('Delta references a block past the end of the file.')
+
+            size += min(end * delta.block_size, base_size) - op.copy_ * delta.block_size
+        else:
+            size += op.data
+
+    return size
+
+
+# Yields the size of each chunk taken from data, so the caller can shape the upload between chunks,
+# and returns the SHA-256 of the rebuilt file.
+def apply_delta(
+    base_path: Path,
+    data: BinaryIO,
+    target_path: Path,
+    delta: FileDelta,
+) -> Generator[int, None, str]:
+    digest = hashlib.sha256()
+
+    with base_path.open('rb') as base, target_path.open('wb') as target:
+        for op in delta.ops:
+            if isinstance(op, DeltaCopy):
+                base.seek(op.copy_ * delta.block_size)
+                remaining = op.count * delta.block_size
+                source = base
+            else:
+                remaining = op.data
+                source = data
+
+            while remaining:
+                chunk = source.read(min(remaining, 1024 * 1024))
+
+                if not chunk:
+                    if source is data:
+                        raise InvalidDeltaError('Delta data is shorter than its ops.')
+                    break
+
+                digest.update(chunk)
+                target.write(chunk)
+                remaining -= len(chunk)
+
+                if source is data:
+                    yield len(chunk)
+
+        if data.read(1):
+            raise InvalidDeltaError('Delta data is longer than its ops.')
+
+    return digest.hexdigest()
+
+
+def advance(steps: Generator[int, None, str]) -> int | str:
+    # StopIteration cannot cross an executor future, so the return value is passed back instead.
+    try:
+        return next(steps)
+    except StopIteration as stop:
+        return stop.value
@@ -0,0 +1,90 @@
+import csv
+import io
+from collections.abc import AsyncIterator, Sequence
+from typing import Literal
+
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row, select
+
+from src.database import replica_router, session_factory
+from src.models import File as FileModel
+from src.settings import files_settings
+
+from .services import FILE_OUT_COLUMNS
+
+
+type ExportFormat = Literal['ndjson', 'csv']
+
+EXPORT_MEDIA_TYPES: dict[ExportFormat, str] = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def encode_ndjson(rows: Sequence[Row]) -> bytes:
+    option = orjson.OPT_UTC_Z | orjson.OPT_APPEND_NEWLINE
+
+    return b''.join(orjson.dumps(dict(row._mapping), option=option) for row in rows)
+
+
+def encode_csv(rows: Sequence[Row]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        (
+            row.id,
+            row.user_id,
+            row.name,
+            row.size,
+            row.content_type,
+            row.visibility.value,
+            row.created_at.isoformat(),
+        )
+        for row in rows
+    )
+
+    return buffer.getvalue().encode()
+
+
+async def stream_files(
+    user_id: int | None,
+    written_at: float | None,
+    export_format: ExportFormat,
+) -> AsyncIterator[bytes]:
+    stmt = (
+        select(*FILE_OUT_COLUMNS)
+        .order_by(FileModel.id)
+        .execution_options(yield_per=files_settings.export_fetch_size)
+    )
+
+    if user_id is not None:
+        stmt = stmt.where(FileModel.user_id == user_id)
+
+    if export_format == 'csv':
+        yield (','.join(column.key for column in FILE_OUT_COLUMNS) + '\r\n').encode()
+
+    encode = encode_csv if export_format == 'csv' else encode_ndjson
+
+    # The request's sessions may be closed before the body is sent, so the stream owns its own.
+    async with (
+        session_factory() as primary_session,
+        replica_router.session(primary_session, written_at) as session,
+    ):
+        result = await session.stream(stmt)
+
+        # One fetch per partition; the next is only issued once the client has taken this one.
+        async for rows in result.partitions():
+            yield encode(rows)
+
+
+def export_response(
+    user_id: int | None,
+    written_at: float | None,
+    export_format: ExportFormat,
+) -> StreamingResponse:
+    return StreamingResponse(
+        stream_files(user_id, written_at, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="files.{export_format}"'},
+    )
@@ -0,0 +1,153 @@
+from datetime import timedelta
+
+from fastapi import HTTPException, status
+from sqlalchemy import case, delete, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models import StorageReservation as StorageReservationModel
+from src.models import User as UserModel
+from src.settings import files_settings
+
+from .utils import subscribe_plan_to_storage_limit
+
+
+storage_limit = case(
+    *(
+        (UserModel.subscribe_plan == plan, limit)
+        for plan, limit in subscribe_plan_to_storage_limit.items()
+    ),
+)
+
+
+async def release_expired_reservations(
+    session: AsyncSession,
+    user_id: int,
+):
+    expired = (
+        delete(StorageReservationModel)
+        .where(
+            StorageReservationModel.user_id == user_id,
+            StorageReservationModel.expires_at < func.now(),
+        )
+        .returning(StorageReservationModel.size)
+        .cte('expired')
+    )
+    stmt = (
+        update(UserModel)
+        .where(
+            UserModel.id == user_id,
+            select(func.count()).select_from(expired).scalar_subquery() > 0,
+        )
+        .values(
+            reserved_storage=UserModel.reserved_storage
+            - select(func.sum(expired.c.size)).scalar_subquery()
+        )
+    )
+    await session.execute(stmt)
+
+
+async def reserve_storage(
+    session: AsyncSession,
+    user_id: int,
+    size: int,
+) -> int:
+    await release_expired_reservations(session, user_id)
+
+    reserved = (
+        update(UserModel)
+        .where(
+            UserModel.id == user_id,
+            UserModel.used_storage + UserModel.reserved_storage + size <= storage_limit,
+        )
+        .values(reserved_storage=UserModel.reserved_storage + size)
+        .returning(UserModel.id)
+        .cte('reserved')
+    )
+    stmt = (
+        insert(StorageReservationModel)
+        .from_select(
+            ['user_id', 'size', 'expires_at'],
+            select(
+                reserved.c.id,
+                literal(size),
+                func.now() + timedelta(minutes=files_settings.reservation_ttl_minutes),
+            ),
+        )
+        .returning(StorageReservationModel.id)
+    )
+    result = await session.execute(stmt)
+    result = result.scalar_one_or_none()
+    await session.commit()
+
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Storage limit exceeded.',
+        )
+
+    return result
+
+
+async def release_storage(
+    session: AsyncSession,
+    reservation_id: int,
+):
+    released = (
+        delete(StorageReservationModel)
+        .where(StorageReservationModel.id == reservation_id)
+        .returning(StorageReservationModel.user_id, StorageReservationModel.size)
+        .cte('released')
+    )
+    stmt = (
+        update(UserModel)
+        .where(UserModel.id == released.c.user_id)
+        .values(reserved_storage=UserModel.reserved_storage - released.c.size)
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+
+async def commit_storage(
+    session: AsyncSession,
+    reservation_id: int,
+    user_id: int,
+    size: int,
+):
+    released = (
+        delete(StorageReservationModel)
+        .where(StorageReservationModel.id == reservation_id)
+        .returning(StorageReservationModel.user_id, StorageReservationModel.size)
+        .cte('released')
+    )
+    stmt = (
+        update(UserModel)
+        .where(UserModel.id == released.c.user_id)
+        .values(
+            used_storage=UserModel.used_storage + released.c.size,
+            reserved_storage=UserModel.reserved_storage - released.c.size,
+        )
+        .returning(UserModel.id)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(stmt)
+
+    if result.scalar_one_or_none() is not None:
+        return
+
+    # The reservation expired and was reclaimed, so the bytes have to fit on their own.
+    stmt = (
+        update(UserModel)
+        .where(
+            UserModel.id == user_id,
+            UserModel.used_storage + UserModel.reserved_storage + size <= storage_limit,
+        )
+        .values(used_storage=UserModel.used_storage + size)
+        .returning(UserModel.id)
+    )
+    result = await session.execute(stmt)
+
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Storage limit exceeded.',
+        )
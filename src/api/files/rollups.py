@@ -0,0 +1,83 @@
+import asyncio
+from datetime import UTC, datetime
+
+from sqlalchemy import Date, cast, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import engine, session_factory
+from src.enums import UserSubscribePlan
+from src.models import File as FileModel
+from src.models import StorageUsageRollup as StorageUsageRollupModel
+from src.models import User as UserModel
+
+
+async def record_storage_usage(
+    session: AsyncSession,
+    subscribe_plan: UserSubscribePlan,
+    content_type: str,
+    size: int,
+    removed: bool = False,
+    files: int = 1,
+):
+    files_column, bytes_column = (
+        ('files_removed', 'bytes_removed') if removed else ('files_added', 'bytes_added')
+    )
+    stmt = insert(StorageUsageRollupModel).values(
+        day=datetime.now(UTC).date(),
+        subscribe_plan=subscribe_plan,
+        content_type=content_type,
+        **{files_column: files, bytes_column: size},
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['day', 'subscribe_plan', 'content_type'],
+        set_={
+            files_column: getattr(StorageUsageRollupModel, files_column) + files,
+            bytes_column: getattr(StorageUsageRollupModel, bytes_column) + size,
+        },
+    )
+    await session.execute(stmt)
+
+
+async def backfill_storage_rollups(session: AsyncSession) -> int:
+    # Blocks uploads and deletes until commit so no change lands between the wipe and the rebuild.
+    await session.execute(text(f'LOCK TABLE {FileModel.__tablename__} IN SHARE MODE'))
+    await session.execute(delete(StorageUsageRollupModel))
+
+    # The upload-time plan of files that predate the column is unknown; the owner's current
+    # plan is the best guess, and removals are attributed to it from then on.
+    await session.execute(
+        update(FileModel)
+        .where(FileModel.subscribe_plan.is_(None), FileModel.user_id == UserModel.id)
+        .values(subscribe_plan=UserModel.subscribe_plan)
+    )
+
+    day = cast(func.timezone('UTC', FileModel.created_at), Date)
+    stmt = select(
+        day,
+        FileModel.subscribe_plan,
+        FileModel.content_type,
+        func.count(),
+        func.sum(FileModel.size),
+    ).group_by(day, FileModel.subscribe_plan, FileModel.content_type)
+    result = await session.execute(
+        insert(StorageUsageRollupModel).from_select(
+            ['day', 'subscribe_plan', 'content_type', 'files_added', 'bytes_added'],
+            stmt,
+        )
+    )
+    await session.commit()
+
+    return result.rowcount  # type: ignore[attr-defined]
+
+
+async def main() -> None:
+    async with session_factory() as session:
+        buckets = await backfill_storage_rollups(session)
+
+    await engine.dispose()
+    print(f'Rebuilt {buckets} storage usage buckets.')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,45 +1,68 @@
-from fastapi import APIRouter, Path, UploadFile, status
-from fastapi.responses import FileResponse
-
-from src.dependencies import current_user_access_dep, current_user_access_optional_dep, session_dep
+from fastapi import APIRouter, Form, Path, Query, Request, UploadFile, status
+
+from src.dependencies import (
+    current_user_access_dep,
+    current_user_access_optional_dep,
+    read_session_dep,
+    session_dep,
+    written_at_dep,
+)
+from src.responses import dump_json, row_response, rows_response
 from src.schemas.files import FileOut as FileOutSchema
+from src.schemas.files import FileSignatures as FileSignaturesSchema
 from src.schemas.files import FileUpdate as FileUpdateSchema
+from src.settings import files_settings
 
 from . import services
+from .export import ExportFormat, export_response
+from .throttling import ThrottledFileResponse, client_identity
 
 
 router = APIRouter()
 
 
-@router.get('')
+@router.get(
+    '',
+    response_model=list[FileOutSchema],
+)
 async def get_files(
     current_user: current_user_access_dep,
-    session: session_dep,
-) -> list[FileOutSchema]:
+    session: read_session_dep,
+):
     result = await services.get_files(
         session,
         current_user.id,
     )
 
-    return result  # type: ignore[return-value]
+    return rows_response(result)
+
+
+@router.get('/export')
+async def export_files(
+    current_user: current_user_access_dep,
+    written_at: written_at_dep,
+    export_format: ExportFormat = Query('ndjson', alias='format'),
+):
+    return export_response(current_user.id, written_at, export_format)
 
 
 @router.get(
     '/{id}',
+    response_model=FileOutSchema,
     description='Authentication optional if the file is public.',
 )
 async def get_file(
     current_user: current_user_access_optional_dep,
-    session: session_dep,
+    session: read_session_dep,
     file_id: int = Path(alias='id'),
-) -> FileOutSchema:
+):
     result = await services.get_file(
         session,
         file_id,
         current_user.id if current_user else None,
     )
 
-    return result  # type: ignore[return-value]
+    return row_response(result, exclude=frozenset({'stored_name'}))
 
 
 @router.post(
@@ -60,8 +83,9 @@ async def add_file(
 
 @router.get('/{id}/download')
 async def download_file(
+    request: Request,
     current_user: current_user_access_optional_dep,
-    session: session_dep,
+    session: read_session_dep,
     file_id: int = Path(alias='id'),
 ):
     result = await services.get_file(
@@ -69,15 +93,57 @@ async def download_file(
         file_id,
         current_user.id if current_user else None,
     )
-    response = FileResponse(
+    response = ThrottledFileResponse(
         f'./storage/{result.stored_name}',
         filename=result.name,
         media_type=result.content_type,
+        identity=client_identity(current_user, request),
     )
 
     return response
 
 
+@router.get(
+    '/{id}/signatures',
+    response_model=FileSignaturesSchema,
+    description='Block signatures of the current content, for building a delta upload.',
+)
+async def get_file_signatures(
+    current_user: current_user_access_dep,
+    session: read_session_dep,
+    file_id: int = Path(alias='id'),
+    block_size: int = files_settings.delta_block_size,
+):
+    result = await services.get_file_signatures(
+        session,
+        current_user.id,
+        file_id,
+        block_size,
+    )
+
+    return dump_json(result)
+
+
+@router.put(
+    '/{id}/content',
+    description='Replace the content with a delta against the current signatures.',
+)
+async def update_file_content(
+    current_user: current_user_access_dep,
+    session: session_dep,
+    delta: str = Form(description='FileDelta as JSON.'),
+    data: UploadFile | None = None,
+    file_id: int = Path(alias='id'),
+):
+    await services.update_file_content(
+        session,
+        current_user,
+        file_id,
+        delta,
+        data,
+    )
+
+
 @router.patch('/{id}')
 async def update_file(
     current_user: current_user_access_dep,
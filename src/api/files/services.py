@@ -1,28 +1,61 @@
+import asyncio
+import io
+import time
 from collections.abc import Sequence
 from pathlib import Path
 from uuid import uuid4
 
-import aiofiles
 from fastapi import HTTPException, UploadFile, status
-from sqlalchemy import delete, insert, select, update
+from pydantic import ValidationError
+from sqlalchemy import Row, delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.database import engine
+from src.metrics import UPLOAD_THROUGHPUT
 from src.models import File as FileModel
 from src.models import User as UserModel
+from src.schemas.files import FileDelta as FileDeltaSchema
 from src.schemas.files import FileUpdate as FileUpdateSchema
 
-from .utils import subscribe_plan_to_storage_limit
+from .cache import file_cache, file_changed
+from .delta import (
+    MAX_BLOCK_SIZE,
+    MIN_BLOCK_SIZE,
+    InvalidDeltaError,
+    advance,
+    apply_delta,
+    compute_signatures,
+    delta_size,
+)
+from .quota import commit_storage, release_storage, reserve_storage
+from .rollups import record_storage_usage
+from .throttling import transfer_shaper, user_identity
+from .writer import upload_writer
+
+
+# Columns of FileOutSchema, selected as Core rows to skip ORM hydration on reads.
+FILE_OUT_COLUMNS = (
+    FileModel.id,
+    FileModel.user_id,
+    FileModel.name,
+    FileModel.size,
+    FileModel.content_type,
+    FileModel.visibility,
+    FileModel.created_at,
+)
 
 
 async def get_files(
     session: AsyncSession,
     user_id: int,
-) -> Sequence[FileModel]:
+) -> Sequence[Row]:
     stmt = (
-        select(FileModel).where(FileModel.user_id == user_id).order_by(FileModel.created_at.desc())
+        select(*FILE_OUT_COLUMNS)
+        .where(FileModel.user_id == user_id)
+        .order_by(FileModel.created_at.desc())
     )
     result = await session.execute(stmt)
-    result = result.scalars().all()
+    result = result.all()
 
     return result
 
@@ -31,16 +64,25 @@ async def get_file(
     session: AsyncSession,
     file_id: int,
     user_id: int | None,
-) -> FileModel:
-    stmt = select(FileModel).where(FileModel.id == file_id)
-    result = await session.execute(stmt)
-    result = result.scalar_one_or_none()
+) -> Row:
+    result = file_cache.get(file_id)
 
-    if not result:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='File not found.',
-        )
+    if result is None:
+        version = file_cache.version
+
+        stmt = select(*FILE_OUT_COLUMNS, FileModel.stored_name).where(FileModel.id == file_id)
+        result = await session.execute(stmt)
+        result = result.one_or_none()
+
+        if not result:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='File not found.',
+            )
+
+        # A lagging replica could return a row older than the last invalidation.
+        if session.bind is engine:
+            file_cache.put(result, version)
 
     if result.visibility == 'private' and result.user_id != user_id:
         raise HTTPException(
@@ -56,39 +98,43 @@ async def add_file(
     user: UserModel,
     file: UploadFile,
 ):
-    if user.used_storage + file.size > subscribe_plan_to_storage_limit[user.subscribe_plan]:  # type: ignore
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail='Storage limit exceeded.',
-        )
+    # Reserving commits, which ends the auth transaction before waiting for a transfer slot.
+    reservation_id = await reserve_storage(session, user.id, file.size)  # type: ignore[arg-type]
 
     stored_name = uuid4().hex
     storage_path = Path('storage') / stored_name
 
     try:
-        async with aiofiles.open(storage_path, 'wb') as out_file:
-            while content := await file.read(4 * 1024 * 1024):  # 4 MB
-                await out_file.write(content)
-    except Exception:
-        storage_path.unlink(missing_ok=True)
-        raise
+        async with transfer_shaper.open('upload', user_identity(user)) as transfer:
+            start = time.perf_counter()
 
-    stmt = (
-        update(UserModel)
-        .where(UserModel.id == user.id)
-        .values(used_storage=UserModel.used_storage + file.size)
-    )
-    await session.execute(stmt)
+            await upload_writer.write(file.file, storage_path, file.size, transfer.consume)
 
-    stmt = insert(FileModel).values(
-        user_id=user.id,
-        name=file.filename,
-        stored_name=stored_name,
-        size=file.size,
-        content_type=file.content_type,
-    )
-    await session.execute(stmt)
-    await session.commit()
+            UPLOAD_THROUGHPUT.observe(file.size / (time.perf_counter() - start))  # type: ignore[operator]
+
+        await commit_storage(session, reservation_id, user.id, file.size)  # type: ignore[arg-type]
+
+        stmt = insert(FileModel).values(
+            user_id=user.id,
+            name=file.filename,
+            stored_name=stored_name,
+            size=file.size,
+            content_type=file.content_type,
+            subscribe_plan=user.subscribe_plan,
+        )
+        await session.execute(stmt)
+        await record_storage_usage(
+            session,
+            user.subscribe_plan,
+            file.content_type,  # type: ignore[arg-type]
+            file.size,  # type: ignore[arg-type]
+        )
+        await session.commit()
+    except BaseException:
+        storage_path.unlink(missing_ok=True)
+        await session.rollback()
+        await release_storage(session, reservation_id)
+        raise
 
 
 async def update_file(
@@ -118,10 +164,14 @@ async def update_file(
             update(FileModel)
             .where(FileModel.id == file_id)
             .values(**data.model_dump(exclude_unset=True))
+            .returning(file_changed(file_id))
         )
         await session.execute(stmt)
         await session.commit()
 
+        # Other workers evict on the notification, this one need not wait for it.
+        file_cache.invalidate(file_id)
+
 
 async def delete_file(
     session: AsyncSession,
@@ -151,9 +201,189 @@ async def delete_file(
         update(UserModel)
         .where(UserModel.id == user_id)
         .values(used_storage=UserModel.used_storage - result.size)
+        .returning(UserModel.subscribe_plan)
     )
-    await session.execute(stmt)
+    subscribe_plan = await session.execute(stmt)
+    subscribe_plan = subscribe_plan.scalar_one()
 
-    stmt = delete(FileModel).where(FileModel.id == file_id)
+    # Removed bytes leave the plan they were added under, even if the owner changed plans.
+    await record_storage_usage(
+        session,
+        result.subscribe_plan or subscribe_plan,
+        result.content_type,
+        result.size,
+        removed=True,
+    )
+
+    stmt = delete(FileModel).where(FileModel.id == file_id).returning(file_changed(file_id))
     await session.execute(stmt)
     await session.commit()
+
+    file_cache.invalidate(file_id)
+
+
+async def get_file_signatures(
+    session: AsyncSession,
+    user_id: int,
+    file_id: int,
+    block_size: int,
+) -> dict:
+    result = await get_file(session, file_id, user_id)
+
+    if result.user_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail='You do not have permission to update this file.',
+        )
+
+    if not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Unsupported block size.',
+        )
+
+    blocks = await asyncio.to_thread(
+        compute_signatures,
+        Path('storage') / result.stored_name,
+        block_size,
+    )
+
+    return {
+        'size': result.size,
+        'block_size': block_size,
+        'blocks': blocks,
+    }
+
+
+async def update_file_content(
+    session: AsyncSession,
+    user: UserModel,
+    file_id: int,
+    raw_delta: str,
+    data: UploadFile | None,
+):
+    try:
+        delta = FileDeltaSchema.model_validate_json(raw_delta)
+    except ValidationError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid delta.',
+        ) from None
+
+    stmt = select(FileModel).where(FileModel.id == file_id)
+    result = await session.execute(stmt)
+    result = result.scalar_one_or_none()
+
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='File not found.',
+        )
+
+    if result.user_id != user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail='You do not have permission to update this file.',
+        )
+
+    # The UPDATE below refreshes result in place, so keep the current content's name and size.
+    base_path = Path('storage') / result.stored_name
+    base_stored_name, base_size = result.stored_name, result.size
+
+    try:
+        new_size = delta_size(delta, base_size)
+    except InvalidDeltaError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error),
+        ) from None
+
+    size_change = new_size - base_size
+    data_file = data.file if data else io.BytesIO()
+
+    reservation_id = None
+
+    # Both branches end the transaction opened by the reads above before the shaped transfer.
+    if size_change > 0:
+        reservation_id = await reserve_storage(session, user.id, size_change)
+    else:
+        await session.commit()
+
+    stored_name = uuid4().hex
+    storage_path = Path('storage') / stored_name
+
+    try:
+        async with transfer_shaper.open('upload', user_identity(user)) as transfer:
+            steps = apply_delta(base_path, data_file, storage_path, delta)
+
+            try:
+                while isinstance(step := await upload_writer.run(advance, steps), int):
+                    await transfer.consume(step)
+            except InvalidDeltaError as error:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(error),
+                ) from None
+            finally:
+                steps.close()
+
+            sha256 = step
+
+            if delta.sha256 is not None and delta.sha256.lower() != sha256:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail='Rebuilt file does not match the expected checksum.',
+                )
+
+            await upload_writer.persist(storage_path)
+
+        # Only swap the content in if nobody replaced it since it was read.
+        stmt = (
+            update(FileModel)
+            .where(
+                FileModel.id == file_id,
+                FileModel.stored_name == base_stored_name,
+            )
+            .values(stored_name=stored_name, size=new_size)
+            .returning(FileModel.id, file_changed(file_id))
+        )
+        updated = await session.execute(stmt)
+
+        if updated.scalar_one_or_none() is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail='File was modified by another request. Fetch signatures again.',
+            )
+
+        if reservation_id is not None:
+            await commit_storage(session, reservation_id, user.id, size_change)
+        elif size_change:
+            stmt = (
+                update(UserModel)
+                .where(UserModel.id == user.id)
+                .values(used_storage=UserModel.used_storage + size_change)
+            )
+            await session.execute(stmt)
+
+        if size_change:
+            await record_storage_usage(
+                session,
+                result.subscribe_plan or user.subscribe_plan,
+                result.content_type,
+                abs(size_change),
+                removed=size_change < 0,
+                files=0,
+            )
+
+        await session.commit()
+    except BaseException:
+        storage_path.unlink(missing_ok=True)
+        await session.rollback()
+
+        if reservation_id is not None:
+            await release_storage(session, reservation_id)
+
+        raise
+
+    file_cache.invalidate(file_id)
+    base_path.unlink(missing_ok=True)
@@ -0,0 +1,168 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import FileResponse
+from starlette.types import Message, Receive, Scope, Send
+
+from src.metrics import (
+    TRANSFER_BYTES,
+    TRANSFER_SLOT_WAIT,
+    TRANSFER_THROTTLED_SECONDS,
+    TRANSFERS_ACTIVE,
+    TRANSFERS_REJECTED,
+    TRANSFERS_THROTTLED,
+)
+from src.models import User as UserModel
+from src.rate_limit import TokenBucket
+from src.settings import files_settings
+
+from .utils import subscribe_plan_to_concurrent_transfers, subscribe_plan_to_transfer_rate
+
+
+@dataclass(frozen=True)
+class TransferIdentity:
+    key: str
+    plan: str
+    rate: int
+    concurrency: int
+
+
+def user_identity(user: UserModel) -> TransferIdentity:
+    return TransferIdentity(
+        key=f'user:{user.id}',
+        plan=user.subscribe_plan.value,
+        rate=subscribe_plan_to_transfer_rate[user.subscribe_plan],
+        concurrency=subscribe_plan_to_concurrent_transfers[user.subscribe_plan],
+    )
+
+
+def client_identity(user: UserModel | None, request: Request) -> TransferIdentity:
+    if user is not None:
+        return user_identity(user)
+
+    return TransferIdentity(
+        key=f'ip:{request.client.host if request.client else "unknown"}',
+        plan='anonymous',
+        rate=files_settings.anonymous_transfer_rate,
+        concurrency=files_settings.anonymous_concurrent_transfers,
+    )
+
+
+class TransferLimiter:
+    def __init__(self, identity: TransferIdentity) -> None:
+        self.identity = identity
+        self.bucket = TokenBucket(
+            identity.rate,
+            identity.rate * files_settings.transfer_burst_seconds,
+        )
+        self.slots = asyncio.Semaphore(identity.concurrency)
+        self.active = 0
+
+    @property
+    def is_idle(self) -> bool:
+        return self.active == 0 and self.bucket.is_full
+
+
+class Transfer:
+    def __init__(self, direction: str, plan: str, bucket: TokenBucket | None) -> None:
+        self.bucket = bucket
+        self.bytes = TRANSFER_BYTES.labels(direction, plan)
+        self.throttled = TRANSFERS_THROTTLED.labels(direction, plan)
+        self.throttled_seconds = TRANSFER_THROTTLED_SECONDS.labels(direction, plan)
+
+    async def consume(self, amount: int) -> None:
+        self.bytes.inc(amount)
+
+        if self.bucket is None:
+            return
+
+        delay = self.bucket.take(amount)
+
+        if delay > 0:
+            self.throttled.inc()
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.throttled.dec()
+                self.throttled_seconds.inc(delay)
+
+
+class TransferShaper:
+    def __init__(self) -> None:
+        self._limiters: dict[tuple[str, str], TransferLimiter] = {}
+
+    def limiter(self, direction: str, identity: TransferIdentity) -> TransferLimiter:
+        key = (direction, identity.key)
+        limiter = self._limiters.get(key)
+
+        if limiter is None or (limiter.identity != identity and limiter.active == 0):
+            if len(self._limiters) > 1024:
+                self._limiters = {
+                    key: limiter for key, limiter in self._limiters.items() if not limiter.is_idle
+                }
+
+            limiter = self._limiters[key] = TransferLimiter(identity)
+
+        return limiter
+
+    @asynccontextmanager
+    async def open(self, direction: str, identity: TransferIdentity) -> AsyncIterator[Transfer]:
+        if not files_settings.transfer_shaping:
+            yield Transfer(direction, identity.plan, None)
+            return
+
+        limiter = self.limiter(direction, identity)
+        start = time.perf_counter()
+
+        try:
+            async with asyncio.timeout(files_settings.transfer_slot_timeout_seconds):
+                await limiter.slots.acquire()
+        except TimeoutError:
+            TRANSFERS_REJECTED.labels(direction, identity.plan).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail='Too many concurrent transfers.',
+                headers={'Retry-After': str(round(files_settings.transfer_slot_timeout_seconds))},
+            ) from None
+
+        TRANSFER_SLOT_WAIT.labels(direction, identity.plan).observe(time.perf_counter() - start)
+        active = TRANSFERS_ACTIVE.labels(direction, identity.plan)
+        active.inc()
+        limiter.active += 1
+
+        try:
+            yield Transfer(direction, identity.plan, limiter.bucket)
+        finally:
+            limiter.active -= 1
+            active.dec()
+            limiter.slots.release()
+
+
+transfer_shaper = TransferShaper()
+
+
+class ThrottledFileResponse(FileResponse):
+    def __init__(self, *args: object, identity: TransferIdentity, **kwargs: object) -> None:
+        super().__init__(*args, **kwargs)  # type: ignore[arg-type]
+        self.identity = identity
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with transfer_shaper.open('download', self.identity) as transfer:
+
+            async def throttled_send(message: Message) -> None:
+                if message['type'] == 'http.response.body':
+                    await transfer.consume(len(message.get('body', b'')))
+
+                await send(message)
+
+            # Drop pathsend so the body goes through throttled_send rather than the server.
+            extensions = {
+                key: value
+                for key, value in scope.get('extensions', {}).items()
+                if key != 'http.response.pathsend'
+            }
+            await super().__call__({**scope, 'extensions': extensions}, receive, throttled_send)
@@ -6,3 +6,15 @@ subscribe_plan_to_storage_limit: dict[UserSubscribePlan, int] = {
     UserSubscribePlan.PLUS: 200 * 1024 * 1024,  # 200 MB
     UserSubscribePlan.PRO: 500 * 1024 * 1024,  # 500 MB
 }
+
+subscribe_plan_to_transfer_rate: dict[UserSubscribePlan, int] = {
+    UserSubscribePlan.BASIC: 2 * 1024 * 1024,  # 2 MB/s
+    UserSubscribePlan.PLUS: 8 * 1024 * 1024,  # 8 MB/s
+    UserSubscribePlan.PRO: 32 * 1024 * 1024,  # 32 MB/s
+}
+
+subscribe_plan_to_concurrent_transfers: dict[UserSubscribePlan, int] = {
+    UserSubscribePlan.BASIC: 2,
+    UserSubscribePlan.PLUS: 4,
+    UserSubscribePlan.PRO: 8,
+}
@@ -0,0 +1,198 @@
+import asyncio
+import errno
+import os
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Literal
+
+from fastapi import HTTPException, status
+
+from src.settings import files_settings
+
+
+type Durability = Literal['none', 'fdatasync', 'group']
+
+
+def preallocate(fd: int, size: int) -> None:
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError as error:
+        # Filesystems without fallocate support just grow the file as it is written.
+        if error.errno not in {errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL}:
+            raise
+
+
+def write_chunk(source: BinaryIO, fd: int, size: int) -> int:
+    chunk = memoryview(source.read(size))
+    written = 0
+
+    while written < len(chunk):
+        written += os.write(fd, chunk[written:])
+
+    return written
+
+
+def sync_files(fds: list[int], directory: Path) -> None:
+    try:
+        for fd in fds:
+            os.fdatasync(fd)
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+    # A new file's directory entry is only durable once the directory itself is synced.
+    dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def resolve(batch: list[tuple[int, asyncio.Future[None]]], error: BaseException | None) -> None:
+    for _, future in batch:
+        # A waiter cancelled by its own upload has already settled its future.
+        if future.done():
+            continue
+
+        if error is None:
+            future.set_result(None)
+        elif isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(error)
+
+
+class GroupCommitter:
+    def __init__(self, executor: ThreadPoolExecutor, window: float) -> None:
+        self.executor = executor
+        self.window = window
+        self._pending: dict[Path, list[tuple[int, asyncio.Future[None]]]] = {}
+        self._flushers: dict[Path, asyncio.Task[None]] = {}
+
+    async def sync(self, fd: int, directory: Path) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(directory, []).append((fd, future))
+
+        if directory not in self._flushers:
+            self._flushers[directory] = asyncio.create_task(self.flush(directory))
+
+        await future
+
+    async def flush(self, directory: Path) -> None:
+        batch: list[tuple[int, asyncio.Future[None]]] = []
+
+        try:
+            # Uploads finishing while a batch syncs wait for the next one, which covers them all.
+            while directory in self._pending:
+                if self.window:
+                    await asyncio.sleep(self.window)
+
+                batch = self._pending.pop(directory)
+
+                try:
+                    await asyncio.get_running_loop().run_in_executor(
+                        self.executor,
+                        sync_files,
+                        [fd for fd, _ in batch],
+                        directory,
+                    )
+                except OSError as error:
+                    resolve(batch, error)
+                else:
+                    resolve(batch, None)
+        except BaseException as error:
+            # The executor closes the current batch's descriptors, but not those still queued.
+            queued = self._pending.pop(directory, [])
+            for fd, _ in queued:
+                os.close(fd)
+
+            resolve(batch + queued, error)
+            raise
+        finally:
+            del self._flushers[directory]
+
+
+class UploadWriter:
+    def __init__(
+        self,
+        io_threads: int,
+        chunk_size: int,
+        durability: Durability,
+        group_commit_window: float,
+    ) -> None:
+        self.executor = ThreadPoolExecutor(io_threads, thread_name_prefix='upload-io')
+        self.chunk_size = chunk_size
+        self.durability = durability
+        self.group_committer = GroupCommitter(self.executor, group_commit_window)
+
+    async def run[T](self, func: Callable[..., T], *args: object) -> T:
+        future = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The thread keeps using the file descriptor, so it must not be closed under it.
+            await asyncio.wait([future])
+            raise
+
+    async def sync(self, fd: int, directory: Path) -> None:
+        # The syncing thread closes its own duplicate, so a cancelled upload can close fd.
+        if self.durability == 'fdatasync':
+            await self.run(sync_files, [os.dup(fd)], directory)
+        elif self.durability == 'group':
+            await self.group_committer.sync(os.dup(fd), directory)
+
+    async def write(
+        self,
+        source: BinaryIO,
+        path: Path,
+        size: int | None,
+        consume: Callable[[int], Awaitable[None]],
+    ) -> int:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        written = 0
+
+        try:
+            if size:
+                try:
+                    await self.run(preallocate, fd, size)
+                except OSError as error:
+                    if error.errno == errno.ENOSPC:
+                        raise HTTPException(
+                            status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+                            detail='Not enough disk space.',
+                        ) from None
+                    raise
+
+            # Reading and writing a chunk share one hop to the executor.
+            while chunk_written := await self.run(write_chunk, source, fd, self.chunk_size):
+                await consume(chunk_written)
+                written += chunk_written
+
+            if size and written < size:
+                await self.run(os.ftruncate, fd, written)
+
+            await self.sync(fd, path.parent)
+        finally:
+            os.close(fd)
+
+        return written
+
+    async def persist(self, path: Path) -> None:
+        if self.durability == 'none':
+            return
+
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            await self.sync(fd, path.parent)
+        finally:
+            os.close(fd)
+
+
+upload_writer = UploadWriter(
+    files_settings.upload_io_threads,
+    files_settings.upload_chunk_size,
+    files_settings.upload_durability,
+    files_settings.upload_group_commit_window_ms / 1000,
+)
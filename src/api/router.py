@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 
+from .admin.router import router as admin_router
 from .auth.router import router as auth_router
 from .files.router import router as files_router
 
@@ -16,3 +17,8 @@ router.include_router(
     prefix='/files',
     tags=['files'],
 )
+router.include_router(
+    admin_router,
+    prefix='/admin',
+    tags=['admin'],
+)
@@ -0,0 +1,189 @@
+import asyncio
+import zlib
+from collections.abc import Callable
+
+import brotli
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.settings import compression_settings
+
+
+class GzipEncoder:
+    def __init__(self) -> None:
+        self.compressor = zlib.compressobj(compression_settings.gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush()
+
+    def process(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self) -> None:
+        self.compressor = brotli.Compressor(quality=compression_settings.brotli_quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.finish()
+
+    def process(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self) -> None:
+        self.compressor = zstandard.ZstdCompressor(level=compression_settings.zstd_level)
+        self.stream = self.compressor.compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def process(self, data: bytes) -> bytes:
+        return self.stream.compress(data) + self.stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.stream.flush()
+
+
+type Encoder = GzipEncoder | BrotliEncoder | ZstdEncoder
+
+ENCODERS: dict[str, Callable[[], Encoder]] = {
+    'br': BrotliEncoder,
+    'zstd': ZstdEncoder,
+    'gzip': GzipEncoder,
+}
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    weights: dict[str, float] = {}
+
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        weight = 1.0
+
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+
+            if name == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+
+        weights[coding.strip().lower()] = weight
+
+    # Highest q wins; ties go to the first encoding in the server's preference order.
+    weight, _, encoding = max(
+        (weights.get(encoding, weights.get('*', 0.0)), -index, encoding)
+        for index, encoding in enumerate(compression_settings.encodings)
+    )
+
+    return encoding if weight > 0 else None
+
+
+def is_compressible(status_code: int, headers: MutableHeaders, size: int | None) -> bool:
+    if status_code < 200 or status_code in {204, 304}:
+        return False
+
+    # Already encoded, or byte ranges of a file that must stay addressable (FileResponse).
+    if {'content-encoding', 'accept-ranges', 'content-range'} & set(headers.keys()):
+        return False
+
+    content_type = headers.get('content-type', '').partition(';')[0].strip()
+
+    if not any(content_type.startswith(type_) for type_ in compression_settings.compressible_types):
+        return False
+
+    return size is None or size >= compression_settings.minimum_size
+
+
+async def encode(func: Callable[[bytes], bytes], data: bytes) -> bytes:
+    if len(data) >= compression_settings.offload_size:
+        return await asyncio.to_thread(func, data)
+
+    return func(data)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+        encoder: Encoder | None = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, encoder
+
+            if message['type'] == 'http.response.start':
+                start_message = message
+                return
+
+            if start_message is not None:
+                start, start_message = start_message, None
+
+                if message['type'] != 'http.response.body':
+                    await send(start)
+                    await send(message)
+                    return
+
+                body = message.get('body', b'')
+                more_body = message.get('more_body', False)
+                headers = MutableHeaders(raw=start['headers'])
+
+                if more_body:
+                    content_length = headers.get('content-length')
+                    size = int(content_length) if content_length else None
+                else:
+                    size = len(body)
+
+                if not is_compressible(start['status'], headers, size):
+                    await send(start)
+                    await send(message)
+                    return
+
+                headers['Content-Encoding'] = encoding
+                headers.add_vary_header('Accept-Encoding')
+
+                if not more_body:
+                    body = await encode(ENCODERS[encoding]().compress, body)
+                    headers['Content-Length'] = str(len(body))
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+
+                del headers['Content-Length']
+                encoder = ENCODERS[encoding]()
+                await send(start)
+
+            if encoder is None or message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = await encode(encoder.process, message.get('body', b''))
+            more_body = message.get('more_body', False)
+
+            if not more_body:
+                body += encoder.finish()
+
+            await send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+        await self.app(scope, receive, send_wrapper)
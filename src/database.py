@@ -1,22 +1,266 @@
-from collections.abc import AsyncGenerator
+import asyncio
+import itertools
+import logging
+import time
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import Connection, case, event, func, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.metrics import (
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_CHECKOUT_WAIT,
+    DB_POOL_OVERFLOW,
+    DB_QUERY_DURATION,
+    DB_REPLICA_FALLBACKS,
+    add_server_timing,
+    request_scope,
+)
+from src.settings import db_settings, server_settings
+from src.slow_queries import record_query
 
-from src.settings import db_settings
 
+logger = logging.getLogger(__name__)
 
-engine = create_async_engine(
-    f'postgresql+asyncpg://{db_settings.user}:{db_settings.password}@{db_settings.host}/{db_settings.name}',
-    pool_size=10,
-    max_overflow=15,
-)
+WRITTEN_AT_COOKIE = 'written_at'
+WRITTEN_AT_HEADER = 'X-Written-At'
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+def build_engine(host: str) -> AsyncEngine:
+    engine = create_async_engine(
+        f'postgresql+asyncpg://{db_settings.user}:{db_settings.password}@{host}/{db_settings.name}',
+        poolclass=InstrumentedPool,
+        pool_size=db_settings.pool_size,
+        max_overflow=db_settings.max_overflow,
+        pool_timeout=db_settings.pool_timeout_seconds,
+        pool_recycle=db_settings.pool_recycle_seconds,
+        pool_pre_ping=db_settings.pool_pre_ping,
+        connect_args={
+            'prepared_statement_cache_size': db_settings.prepared_statement_cache_size,
+            'statement_cache_size': db_settings.statement_cache_size,
+            'server_settings': {
+                'statement_timeout': str(db_settings.statement_timeout_ms),
+            },
+        },
+    )
+    pool = engine.sync_engine.pool
+
+    @event.listens_for(engine.sync_engine, 'checkout')
+    @event.listens_for(engine.sync_engine, 'checkin')
+    def update_pool_gauges(*_: object) -> None:
+        DB_POOL_CHECKED_OUT.labels(host).set(pool.checkedout())  # type: ignore[attr-defined]
+        DB_POOL_OVERFLOW.labels(host).set(max(pool.overflow(), 0))  # type: ignore[attr-defined]
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def start_query_timer(conn: Connection, *_: object) -> None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def stop_query_timer(
+        conn: Connection,
+        _cursor: object,
+        statement: str,
+        parameters: object,
+        _context: object,
+        executemany: bool,
+    ) -> None:
+        duration = time.perf_counter() - conn.info['query_start'].pop()
+        DB_QUERY_DURATION.labels(statement.split(None, 1)[0].upper()).observe(duration)
+        add_server_timing('db', duration)
+        record_query(engine, statement, parameters, executemany, duration)
+
+    return engine
+
+
+class PrimarySession(Session):
+    pass
+
+
+engine = build_engine(db_settings.host)
 session_factory = async_sessionmaker(
     engine,
+    sync_session_class=PrimarySession,
+    autoflush=False,
+    autocommit=False,
+    expire_on_commit=False,
+)
+replica_engines = [build_engine(host) for host in db_settings.replica_hosts]
+replica_session_factory = async_sessionmaker(
     autoflush=False,
     autocommit=False,
     expire_on_commit=False,
 )
 
+workers_count = server_settings.workers_count or 1
+max_connections = workers_count * (db_settings.pool_size + db_settings.max_overflow)
+
+if db_settings.connection_budget is not None and max_connections > db_settings.connection_budget:
+    logger.warning(
+        '%s workers x (pool_size %s + max_overflow %s) = %s connections exceeds the budget of %s.',
+        workers_count,
+        db_settings.pool_size,
+        db_settings.max_overflow,
+        max_connections,
+        db_settings.connection_budget,
+    )
+
+
+# Seconds the replica is behind the primary; 0 once it has replayed all received WAL,
+# and on a server that is not in recovery at all.
+REPLICA_LAG = select(
+    func.coalesce(
+        case(
+            (func.pg_last_wal_receive_lsn() == func.pg_last_wal_replay_lsn(), 0),
+            else_=func.extract('epoch', func.now() - func.pg_last_xact_replay_timestamp()),
+        ),
+        0,
+    )
+)
+
+
+class ReplicaRouter:
+    def __init__(self, engines: list[AsyncEngine]) -> None:
+        self.engines = engines
+        self._cycle = itertools.cycle(engines)
+        self._down_until: dict[AsyncEngine, float] = {}
+        self._replayed_until: dict[AsyncEngine, float] = {}
+
+    def is_caught_up(self, engine: AsyncEngine, written_at: float | None) -> bool:
+        if written_at is None:
+            return True
+
+        replayed_until = self._replayed_until.get(engine)
+
+        if replayed_until is None:
+            return time.time() - written_at > db_settings.read_your_writes_seconds
+
+        return replayed_until >= written_at
+
+    async def check_lag(self, engine: AsyncEngine) -> None:
+        checked_at = time.time()
+
+        async with engine.connect() as connection:
+            lag = await connection.scalar(REPLICA_LAG)
+
+        self._replayed_until[engine] = checked_at - float(lag)
+
+    async def track_lag(self) -> None:
+        while True:
+            for engine in self.engines:
+                try:
+                    await self.check_lag(engine)
+                except (OSError, TimeoutError, DBAPIError):
+                    self._replayed_until.pop(engine, None)
+
+            await asyncio.sleep(db_settings.replica_lag_check_seconds)
+
+    async def connect(self, written_at: float | None) -> AsyncSession | None:
+        for _ in range(len(self.engines)):
+            engine = next(self._cycle)
+
+            if self._down_until.get(engine, 0) > time.monotonic():
+                continue
+
+            if not self.is_caught_up(engine, written_at):
+                continue
+
+            session = replica_session_factory(bind=engine)
+            try:
+                await session.connection()
+            except (OSError, TimeoutError, DBAPIError):
+                logger.warning('Replica %s is unavailable, skipping it.', engine.url)
+                self._down_until[engine] = time.monotonic() + db_settings.replica_retry_seconds
+                await session.close()
+                continue
+
+            return session
+
+        return None
+
+    @asynccontextmanager
+    async def session(
+        self,
+        primary_session: AsyncSession,
+        written_at: float | None,
+    ) -> AsyncIterator[AsyncSession]:
+        if self.engines:
+            session = await self.connect(written_at)
+
+            if session is not None:
+                async with session:
+                    yield session
+
+                return
+
+            DB_REPLICA_FALLBACKS.inc()
+
+        yield primary_session
+
+
+replica_router = ReplicaRouter(replica_engines)
+
+
+# A client's later reads only go to replicas that have replayed past its last write. The
+# time is sent back as a cookie and a header for clients without a cookie jar to echo, and
+# access tokens carry their issue time, so every worker can tell, not just the one that
+# handled the write.
+@event.listens_for(PrimarySession, 'after_commit')
+def mark_user_write(session: Session) -> None:
+    if session.info.get('user_id') is not None and (scope := request_scope.get()) is not None:
+        scope['written_at'] = time.time()
+
+
+def parse_written_at(value: str | None) -> float | None:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class WrittenAtMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start' and 'written_at' in scope:
+                headers = MutableHeaders(scope=message)
+                headers[WRITTEN_AT_HEADER] = str(scope['written_at'])
+                headers.append(
+                    'Set-Cookie',
+                    f'{WRITTEN_AT_COOKIE}={scope["written_at"]}; '
+                    f'Max-Age={db_settings.written_at_cookie_max_age_seconds}; '
+                    'Path=/; HttpOnly; SameSite=Lax',
+                )
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
 
 async def get_session() -> AsyncGenerator[AsyncSession]:
     async with session_factory() as session:
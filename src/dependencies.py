@@ -3,14 +3,29 @@ from typing import Annotated
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.api.auth.dependencies import get_current_user_wrapper
+from src.api.auth.dependencies import (
+    get_current_admin,
+    get_current_user_wrapper,
+    get_read_session,
+    get_written_at,
+)
 from src.database import get_session
 from src.models import User as UserModel
 
 
+# Function scope releases connections once the endpoint returns, not after the response
+# body is sent, which for throttled downloads can take minutes.
 session_dep = Annotated[
     AsyncSession,
-    Depends(get_session),
+    Depends(get_session, scope='function'),
+]
+read_session_dep = Annotated[
+    AsyncSession,
+    Depends(get_read_session, scope='function'),
+]
+written_at_dep = Annotated[
+    float | None,
+    Depends(get_written_at),
 ]
 current_user_access_dep = Annotated[
     UserModel,
@@ -24,3 +39,7 @@ current_user_access_optional_dep = Annotated[
     UserModel | None,
     Depends(get_current_user_wrapper('access', required=False)),
 ]
+current_admin_dep = Annotated[
+    UserModel,
+    Depends(get_current_admin),
+]
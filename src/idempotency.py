@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+from datetime import UTC, datetime, timedelta
+
+from fastapi import status
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy import Row, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.api.auth.dependencies import decode_jwt
+from src.database import session_factory
+from src.models import IdempotencyKey as IdempotencyKeyModel
+from src.settings import idempotency_settings
+
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+def get_user_id(headers: Headers) -> int | None:
+    scheme, _, token = headers.get('authorization', '').partition(' ')
+
+    if scheme != 'Bearer' or not (payload := decode_jwt(token)):
+        return None
+
+    if payload['type'] != 'access' or payload['expires_at'] < int(time.time()):
+        return None
+
+    return payload['user_id']
+
+
+def is_replayable(status_code: int) -> bool:
+    # Server errors and rate limits are worth retrying, so the key is released for them.
+    return status_code < 500 and status_code != 429
+
+
+async def claim(user_id: int, key: str, method: str, path: str) -> bool:
+    now = datetime.now(UTC)
+    stmt = insert(IdempotencyKeyModel).values(
+        user_id=user_id,
+        key=key,
+        method=method,
+        path=path,
+        expires_at=now + timedelta(hours=idempotency_settings.ttl_hours),
+    )
+    # Take over keys that expired or whose original request died without finishing.
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'key'],
+        set_={
+            'method': stmt.excluded.method,
+            'path': stmt.excluded.path,
+            'response_status': None,
+            'response_content_type': None,
+            'response_body': None,
+            'expires_at': stmt.excluded.expires_at,
+            'created_at': func.now(),
+        },
+        where=or_(
+            IdempotencyKeyModel.expires_at < now,
+            (IdempotencyKeyModel.response_status.is_(None))
+            & (
+                IdempotencyKeyModel.created_at
+                < now - timedelta(seconds=idempotency_settings.in_flight_timeout_seconds)
+            ),
+        ),
+    ).returning(IdempotencyKeyModel.id)
+
+    async with session_factory() as session:
+        result = await session.execute(stmt)
+        result = result.scalar_one_or_none()
+        await session.commit()
+
+    return result is not None
+
+
+async def wait_for_response(
+    user_id: int,
+    key: str,
+    method: str,
+    path: str,
+) -> Row | None:
+    stmt = select(
+        IdempotencyKeyModel.method,
+        IdempotencyKeyModel.path,
+        IdempotencyKeyModel.response_status,
+        IdempotencyKeyModel.response_content_type,
+        IdempotencyKeyModel.response_body,
+    ).where(
+        IdempotencyKeyModel.user_id == user_id,
+        IdempotencyKeyModel.key == key,
+    )
+    deadline = time.monotonic() + idempotency_settings.wait_timeout_seconds
+
+    async with session_factory() as session:
+        while True:
+            result = await session.execute(stmt)
+            result = result.one_or_none()
+            await session.rollback()
+
+            if (
+                result is None
+                or result.response_status is not None
+                or (result.method, result.path) != (method, path)
+                or time.monotonic() > deadline
+            ):
+                return result
+
+            await asyncio.sleep(idempotency_settings.poll_interval_seconds)
+
+
+async def store_response(
+    user_id: int,
+    key: str,
+    status_code: int,
+    content_type: str | None,
+    body: bytes,
+) -> None:
+    if not is_replayable(status_code):
+        await release(user_id, key)
+        return
+
+    async with session_factory() as session:
+        stmt = (
+            update(IdempotencyKeyModel)
+            .where(
+                IdempotencyKeyModel.user_id == user_id,
+                IdempotencyKeyModel.key == key,
+            )
+            .values(
+                response_status=status_code,
+                response_content_type=content_type,
+                response_body=body,
+            )
+        )
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def release(user_id: int, key: str) -> None:
+    async with session_factory() as session:
+        stmt = delete(IdempotencyKeyModel).where(
+            IdempotencyKeyModel.user_id == user_id,
+            IdempotencyKeyModel.key == key,
+        )
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def sweep_expired_keys() -> None:
+    while True:
+        try:
+            async with session_factory() as session:
+                stmt = delete(IdempotencyKeyModel).where(
+                    IdempotencyKeyModel.expires_at < func.now()
+                )
+                await session.execute(stmt)
+                await session.commit()
+        except Exception:
+            logger.exception('Failed to delete expired idempotency keys.')
+
+        await asyncio.sleep(idempotency_settings.sweep_interval_seconds)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['method'] not in IDEMPOTENT_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        key = headers.get('idempotency-key')
+        user_id = get_user_id(headers) if key is not None else None
+
+        # Anonymous requests fall through so the route reports the auth error as usual.
+        if key is None or user_id is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not 0 < len(key) <= 255:
+            response = ORJSONResponse(
+                {'detail': 'Idempotency-Key must be 1 to 255 characters.'},
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
+            await response(scope, receive, send)
+            return
+
+        method, path = scope['method'], scope['path']
+
+        # When the original request fails it releases the key, and the retry claims it instead.
+        while not await claim(user_id, key, method, path):
+            record = await wait_for_response(user_id, key, method, path)
+
+            if record is not None:
+                response = self.replay(record, method, path)
+                await response(scope, receive, send)
+                return
+
+        status_code = 500
+        content_type = None
+        body = bytearray()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, content_type
+
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                content_type = Headers(raw=message['headers']).get('content-type')
+            elif message['type'] == 'http.response.body':
+                body.extend(message.get('body', b''))
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            await release(user_id, key)
+            raise
+
+        await store_response(user_id, key, status_code, content_type, bytes(body))
+
+    def replay(self, record: Row, method: str, path: str) -> Response:
+        if (record.method, record.path) != (method, path):
+            return ORJSONResponse(
+                {'detail': 'Idempotency-Key was already used for a different request.'},
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            )
+
+        if record.response_status is None:
+            return ORJSONResponse(
+                {'detail': 'A request with this Idempotency-Key is still in progress.'},
+                status_code=status.HTTP_409_CONFLICT,
+            )
+
+        return Response(
+            record.response_body,
+            status_code=record.response_status,
+            media_type=record.response_content_type,
+            headers={'Idempotent-Replayed': 'true'},
+        )
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import ORJSONResponse
+from prometheus_client import multiprocess
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from src.api.auth.availability import availability_filter
+from src.api.auth.dependencies import get_private_key, get_public_key
+from src.api.files.cache import file_cache
+from src.api.files.services import FILE_OUT_COLUMNS
+from src.database import engine, replica_engines, replica_router
+from src.idempotency import sweep_expired_keys
+from src.models import File as FileModel
+from src.models import RefreshToken as RefreshTokenModel
+from src.models import User as UserModel
+from src.settings import db_settings
+
+
+logger = logging.getLogger(__name__)
+
+# Same shapes as the statements run on every request, so their compiled forms and
+# asyncpg prepared statements are cached before traffic arrives.
+HOT_STATEMENTS = [
+    select(UserModel).where(UserModel.id == 0),
+    select(RefreshTokenModel).where(RefreshTokenModel.token_hash == ''),
+    select(*FILE_OUT_COLUMNS).where(FileModel.user_id == 0).order_by(FileModel.created_at.desc()),
+    select(*FILE_OUT_COLUMNS, FileModel.stored_name).where(FileModel.id == 0),
+]
+
+
+async def warm_up_connection(connection: AsyncConnection) -> None:
+    for stmt in HOT_STATEMENTS:
+        await connection.execute(stmt)
+
+
+async def warm_up_engine(engine: AsyncEngine) -> None:
+    count = min(db_settings.warmup_connections, db_settings.pool_size)
+
+    async with AsyncExitStack() as stack:
+        connections = await asyncio.gather(
+            *(stack.enter_async_context(engine.connect()) for _ in range(count))
+        )
+        await asyncio.gather(*(warm_up_connection(c) for c in connections))
+
+
+async def warm_up_replica(engine: AsyncEngine) -> None:
+    # An unreachable replica must not stop the worker; reads fall back to the primary.
+    try:
+        await warm_up_engine(engine)
+    except (OSError, TimeoutError, DBAPIError):
+        logger.warning('Could not warm up replica %s, skipping it.', engine.url)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    app.state.ready = False
+
+    get_private_key()
+    get_public_key()
+    await asyncio.gather(warm_up_engine(engine), *(warm_up_replica(e) for e in replica_engines))
+    await availability_filter.rebuild()
+    background_tasks = [
+        asyncio.create_task(availability_filter.keep_fresh()),
+        asyncio.create_task(sweep_expired_keys()),
+        asyncio.create_task(file_cache.listen()),
+        asyncio.create_task(replica_router.track_lag()),
+    ]
+
+    app.state.ready = True
+
+    yield
+
+    app.state.ready = False
+
+    for task in background_tasks:
+        task.cancel()
+
+    # They may still hold pooled connections until their cancellation is processed.
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await asyncio.gather(*(e.dispose() for e in [engine, *replica_engines]))
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+async def ready(request: Request) -> ORJSONResponse:
+    if not getattr(request.app.state, 'ready', False):
+        return ORJSONResponse(
+            {'status': 'starting'},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+    return ORJSONResponse({'status': 'ready'})
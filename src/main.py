@@ -2,6 +2,12 @@ from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 
 from src.api.router import router as api_router
+from src.compression import CompressionMiddleware
+from src.database import WrittenAtMiddleware
+from src.idempotency import IdempotencyMiddleware
+from src.lifespan import lifespan, ready
+from src.metrics import MetricsMiddleware, metrics
+from src.profiling import ProfilingMiddleware
 from src.settings import app_settings
 
 
@@ -9,11 +15,19 @@ def create_app() -> FastAPI:
     app = FastAPI(
         title='fastapi-app',
         default_response_class=ORJSONResponse,
+        lifespan=lifespan,
         swagger_ui_parameters={'defaultModelsExpandDepth': -1},
         docs_url='/docs' if app_settings.environment == 'development' else None,
         redoc_url='/redoc' if app_settings.environment == 'development' else None,
         openapi_url='/openapi.json' if app_settings.environment == 'development' else None,
     )
     app.include_router(api_router)
+    app.add_route('/metrics', metrics, include_in_schema=False)
+    app.add_route('/ready', ready, include_in_schema=False)
+    app.add_middleware(WrittenAtMiddleware)
+    app.add_middleware(IdempotencyMiddleware)
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(MetricsMiddleware)
 
     return app
@@ -0,0 +1,234 @@
+import functools
+import os
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a connection from the pool.',
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out_connections',
+    'Connections currently checked out of the pool.',
+    ['host'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_OVERFLOW = Gauge(
+    'db_pool_overflow_connections',
+    'Connections currently open beyond pool_size.',
+    ['host'],
+    multiprocess_mode='livesum',
+)
+DB_REPLICA_FALLBACKS = Counter(
+    'db_replica_fallbacks_total',
+    'Reads sent to the primary because no replica was available.',
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds',
+    'Time spent executing SQL statements.',
+    ['operation'],
+    buckets=LATENCY_BUCKETS,
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency.',
+    ['method', 'route', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress',
+    'HTTP requests currently being served.',
+    ['method'],
+    multiprocess_mode='livesum',
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    'HTTP response body size.',
+    ['method', 'route'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864),
+)
+
+FUNCTION_DURATION = Histogram(
+    'function_duration_seconds',
+    'Time spent in expensive helpers such as password hashing, JWT signing and SMTP.',
+    ['function'],
+    buckets=LATENCY_BUCKETS,
+)
+UPLOAD_THROUGHPUT = Histogram(
+    'upload_throughput_bytes_per_second',
+    'Bytes per second written to storage by uploads.',
+    buckets=(2**20, 5 * 2**20, 10 * 2**20, 25 * 2**20, 50 * 2**20, 100 * 2**20, 250 * 2**20),
+)
+
+TRANSFERS_ACTIVE = Gauge(
+    'transfers_active',
+    'Uploads and downloads currently holding a transfer slot.',
+    ['direction', 'plan'],
+    multiprocess_mode='livesum',
+)
+TRANSFERS_THROTTLED = Gauge(
+    'transfers_throttled',
+    'Transfers currently paused by their bandwidth limit.',
+    ['direction', 'plan'],
+    multiprocess_mode='livesum',
+)
+TRANSFER_BYTES = Counter(
+    'transfer_bytes_total',
+    'Bytes moved by uploads and downloads.',
+    ['direction', 'plan'],
+)
+TRANSFER_THROTTLED_SECONDS = Counter(
+    'transfer_throttled_seconds_total',
+    'Time transfers spent paused by their bandwidth limit.',
+    ['direction', 'plan'],
+)
+TRANSFER_SLOT_WAIT = Histogram(
+    'transfer_slot_wait_seconds',
+    'Time spent waiting for a free concurrent transfer slot.',
+    ['direction', 'plan'],
+    buckets=LATENCY_BUCKETS,
+)
+TRANSFERS_REJECTED = Counter(
+    'transfers_rejected_total',
+    'Transfers rejected because no slot freed up in time.',
+    ['direction', 'plan'],
+)
+
+AVAILABILITY_CHECKS = Counter(
+    'availability_checks_total',
+    'Name/email availability checks, by whether the filter or the database answered.',
+    ['field', 'result'],
+)
+
+FILE_CACHE_LOOKUPS = Counter(
+    'file_cache_lookups_total',
+    'File metadata lookups, by whether the per-worker cache had the row.',
+    ['result'],
+)
+FILE_CACHE_INVALIDATION_LAG = Histogram(
+    'file_cache_invalidation_lag_seconds',
+    'Time from a file change being sent to the cache entry being evicted.',
+    buckets=LATENCY_BUCKETS,
+)
+FILE_CACHE_FLUSHES = Counter(
+    'file_cache_flushes_total',
+    'Whole file metadata cache flushes, done whenever invalidations may have been missed.',
+)
+
+
+server_timings: ContextVar[dict[str, list[float]] | None] = ContextVar(
+    'server_timings',
+    default=None,
+)
+
+
+request_scope: ContextVar[Scope | None] = ContextVar('request_scope', default=None)
+
+
+def current_route() -> str | None:
+    scope = request_scope.get()
+
+    if scope is None:
+        return None
+
+    return getattr(scope.get('route'), 'path', scope['path'])
+
+
+def add_server_timing(name: str, duration: float) -> None:
+    timings = server_timings.get()
+
+    if timings is not None:
+        entry = timings.setdefault(name, [0.0, 0])
+        entry[0] += duration
+        entry[1] += 1
+
+
+def timed[**P, R](function: str, timing: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    histogram = FUNCTION_DURATION.labels(function)
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                histogram.observe(duration)
+                add_server_timing(timing, duration)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status_code = 500
+        response_size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_size
+
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            elif message['type'] == 'http.response.body':
+                response_size += len(message.get('body', b''))
+
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        scope_token = request_scope.set(scope)
+        start = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            in_progress.dec()
+            request_scope.reset(scope_token)
+
+            route = scope.get('route')
+            route_path = getattr(route, 'path', '<unmatched>')
+
+            HTTP_REQUEST_DURATION.labels(method, route_path, status_code).observe(duration)
+            HTTP_RESPONSE_SIZE.labels(method, route_path).observe(response_size)
+
+
+async def metrics(_: Request) -> Response:
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
 
-from sqlalchemy import DateTime, ForeignKey, func
+from sqlalchemy import BigInteger, DateTime, ForeignKey, UniqueConstraint, func
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column
 
 from src.enums import FileVisibility, UserScope, UserSubscribePlan
@@ -19,10 +19,13 @@ class User(Base):
     scope: Mapped[UserScope] = mapped_column(default=UserScope.USER)
     password_hash: Mapped[str]
     used_storage: Mapped[int] = mapped_column(default=0)
+    reserved_storage: Mapped[int] = mapped_column(default=0, server_default='0')
 
+    # Indexed for the availability filter's periodic scan of recent sign-ups.
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         server_default=func.now(),
+        index=True,
     )
 
 
@@ -65,6 +68,55 @@ class File(Base):
     size: Mapped[int]
     content_type: Mapped[str]
     visibility: Mapped[FileVisibility] = mapped_column(default=FileVisibility.PRIVATE)
+    # Plan of the owner at upload time, so storage rollups keep the bytes under that plan.
+    # NULL for files uploaded before it was recorded, until the rollup backfill sets it.
+    subscribe_plan: Mapped[UserSubscribePlan | None]
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+    )
+
+
+class StorageReservation(Base):
+    __tablename__ = 'storage_reservations'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'), index=True)
+    size: Mapped[int]
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+    )
+
+
+class StorageUsageRollup(Base):
+    __tablename__ = 'storage_usage_rollups'
+
+    day: Mapped[date] = mapped_column(primary_key=True)
+    subscribe_plan: Mapped[UserSubscribePlan] = mapped_column(primary_key=True)
+    content_type: Mapped[str] = mapped_column(primary_key=True)
+    files_added: Mapped[int] = mapped_column(default=0)
+    bytes_added: Mapped[int] = mapped_column(BigInteger, default=0)
+    files_removed: Mapped[int] = mapped_column(default=0)
+    bytes_removed: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (UniqueConstraint('user_id', 'key'),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+    key: Mapped[str]
+    method: Mapped[str]
+    path: Mapped[str]
+    response_status: Mapped[int | None]
+    response_content_type: Mapped[str | None]
+    response_body: Mapped[bytes | None]
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
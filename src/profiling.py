@@ -0,0 +1,70 @@
+import asyncio
+import secrets
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+from pyinstrument import Profiler
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.metrics import server_timings
+from src.settings import app_settings
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    def is_allowed(self, value: str) -> bool:
+        if app_settings.environment != 'production':
+            return True
+
+        secret = app_settings.profiling_secret
+        return secret is not None and secrets.compare_digest(value, secret)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        value = Headers(scope=scope).get('x-profile')
+
+        if value is None or not self.is_allowed(value):
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict[str, list[float]] = {}
+        token = server_timings.set(timings)
+        file_name = f'{datetime.now(UTC):%Y%m%dT%H%M%S}-{secrets.token_hex(4)}.html'
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(scope=message)
+                headers.append('Server-Timing', format_server_timing(timings, start))
+                headers.append('X-Profile-File', file_name)
+
+            await send(message)
+
+        profiler = Profiler(async_mode='enabled')
+        profiler.start()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            server_timings.reset(token)
+
+            path = Path(app_settings.profiles_dir) / file_name
+            await asyncio.to_thread(path.write_text, profiler.output_html(), 'utf-8')
+
+
+def format_server_timing(timings: dict[str, list[float]], start: float) -> str:
+    metrics = [
+        f'{name};dur={duration * 1000:.2f};desc="{count} calls"'
+        for name, (duration, count) in timings.items()
+    ]
+    metrics.append(f'app;dur={(time.perf_counter() - start) * 1000:.2f}')
+
+    return ', '.join(metrics)
@@ -0,0 +1,57 @@
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float) -> float:
+        # Tokens may go negative so concurrent callers queue up behind each other's debt.
+        self.refill()
+        self.tokens -= amount
+
+        return max(0.0, -self.tokens / self.rate)
+
+    def try_take(self, amount: float) -> float:
+        self.refill()
+
+        if self.tokens < amount:
+            return (amount - self.tokens) / self.rate
+
+        self.tokens -= amount
+
+        return 0.0
+
+    @property
+    def is_full(self) -> bool:
+        self.refill()
+
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets: dict[str, TokenBucket] = {}
+
+    def check(self, key: str) -> float:
+        bucket = self._buckets.get(key)
+
+        if bucket is None:
+            if len(self._buckets) > 1024:
+                self._buckets = {
+                    key: bucket for key, bucket in self._buckets.items() if not bucket.is_full
+                }
+
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+
+        return bucket.try_take(1)
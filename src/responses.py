@@ -0,0 +1,28 @@
+from collections.abc import Sequence
+
+import orjson
+from fastapi.responses import Response
+from sqlalchemy import Row
+
+
+class RawJSONResponse(Response):
+    media_type = 'application/json'
+
+
+def dump_json(content: object) -> RawJSONResponse:
+    return RawJSONResponse(orjson.dumps(content, option=orjson.OPT_UTC_Z))
+
+
+def row_to_dict(row: Row, exclude: frozenset[str] = frozenset()) -> dict[str, object]:
+    if not exclude:
+        return dict(row._mapping)
+
+    return {key: value for key, value in row._mapping.items() if key not in exclude}
+
+
+def rows_response(rows: Sequence[Row], exclude: frozenset[str] = frozenset()) -> RawJSONResponse:
+    return dump_json([row_to_dict(row, exclude) for row in rows])
+
+
+def row_response(row: Row, exclude: frozenset[str] = frozenset()) -> RawJSONResponse:
+    return dump_json(row_to_dict(row, exclude))
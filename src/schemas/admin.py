@@ -0,0 +1,25 @@
+from datetime import date
+
+from pydantic import BaseModel
+
+from src.enums import UserSubscribePlan
+
+
+class PlanStorage(BaseModel):
+    subscribe_plan: UserSubscribePlan
+    files: int
+    bytes: int
+
+
+class ContentTypeStorage(BaseModel):
+    content_type: str
+    files: int
+    bytes: int
+
+
+class DailyStorage(BaseModel):
+    day: date
+    files_added: int
+    bytes_added: int
+    files_removed: int
+    bytes_removed: int
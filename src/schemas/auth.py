@@ -21,3 +21,8 @@ class Token(BaseModel):
 class VerifyOTP(BaseModel):
     email: EmailStr
     otp: str = Field(min_length=6, max_length=6)
+
+
+class Availability(BaseModel):
+    name: bool | None = None
+    email: bool | None = None
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from src.enums import FileVisibility
 
@@ -29,3 +29,29 @@ class FileOut(BaseModel):
 class FileUpdate(BaseModel):
     name: str | None = None
     visibility: FileVisibility | None = None
+
+
+class BlockSignature(BaseModel):
+    weak: int
+    strong: str
+
+
+class FileSignatures(BaseModel):
+    size: int
+    block_size: int
+    blocks: list[BlockSignature]
+
+
+class DeltaCopy(BaseModel):
+    copy_: int = Field(alias='copy', ge=0)
+    count: int = Field(default=1, ge=1)
+
+
+class DeltaData(BaseModel):
+    data: int = Field(ge=1)
+
+
+class FileDelta(BaseModel):
+    block_size: int
+    ops: list[DeltaCopy | DeltaData]
+    sha256: str | None = None
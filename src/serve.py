@@ -0,0 +1,130 @@
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import time
+from types import FrameType
+from typing import Any
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from src.settings import db_settings, server_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers_count() -> int:
+    workers = os.process_cpu_count() or 1
+
+    if db_settings.connection_budget is not None:
+        per_worker = db_settings.pool_size + db_settings.max_overflow
+        workers = min(workers, max(db_settings.connection_budget // per_worker, 1))
+
+    return workers
+
+
+def config_kwargs() -> dict[str, Any]:
+    return {
+        'app': 'src.main:create_app',
+        'factory': True,
+        'host': server_settings.host,
+        'port': server_settings.port,
+        'loop': 'uvloop',
+        'http': 'httptools',
+        'backlog': server_settings.backlog,
+        'timeout_keep_alive': server_settings.keep_alive_seconds,
+        'limit_concurrency': server_settings.limit_concurrency,
+        'server_header': False,
+        'date_header': False,
+        'use_colors': False,
+        'access_log': False,
+    }
+
+
+def max_requests() -> int | None:
+    if server_settings.limit_max_requests is None:
+        return None
+
+    # Jitter keeps workers started together from all recycling at the same moment.
+    return server_settings.limit_max_requests + random.randint(
+        0, server_settings.limit_max_requests_jitter
+    )
+
+
+class JitteredServer(uvicorn.Server):
+    def run(self, sockets: list[socket.socket] | None = None) -> None:
+        # Runs in each worker, and again whenever one is restarted, so every worker draws
+        # its own request limit.
+        self.config.limit_max_requests = max_requests()
+        super().run(sockets=sockets)
+
+
+def run_reuse_port_worker() -> None:
+    family = socket.AF_INET6 if ':' in server_settings.host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((server_settings.host, server_settings.port))
+
+    config = uvicorn.Config(**config_kwargs())
+    JitteredServer(config).run(sockets=[sock])
+
+
+def supervise_reuse_port_workers(workers_count: int) -> None:
+    context = multiprocessing.get_context('spawn')
+    processes: list[multiprocessing.process.BaseProcess] = []
+    stopping = False
+
+    def stop(_signum: int, _frame: FrameType | None) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers_count):
+        process = context.Process(target=run_reuse_port_worker)
+        process.start()
+        processes.append(process)
+
+    while not stopping:
+        time.sleep(0.5)
+
+        for index, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                logger.warning(
+                    'Worker %s exited with %s, restarting.', process.pid, process.exitcode
+                )
+                processes[index] = context.Process(target=run_reuse_port_worker)
+                processes[index].start()
+
+    for process in processes:
+        process.terminate()
+
+    for process in processes:
+        process.join()
+
+
+def main() -> None:
+    workers_count = server_settings.workers_count or default_workers_count()
+
+    # Workers re-read settings on import, so they see the resolved count too.
+    os.environ['API_WORKERS_COUNT'] = str(workers_count)
+
+    if server_settings.reuse_port:
+        supervise_reuse_port_workers(workers_count)
+    elif workers_count > 1:
+        # uvicorn.run would hand every worker the same limit_max_requests.
+        config = uvicorn.Config(**config_kwargs(), workers=workers_count)
+        server = JitteredServer(config)
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        JitteredServer(uvicorn.Config(**config_kwargs())).run()
+
+
+if __name__ == '__main__':
+    main()
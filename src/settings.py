@@ -12,6 +12,44 @@ class AppSettings(BaseSettings):
     )
 
     environment: Literal['development', 'production'] = 'development'
+    profiling_secret: str | None = None
+    profiles_dir: str = 'profiles'
+
+
+class ServerSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file='.env',
+        env_prefix='API_',
+        env_file_encoding='utf-8',
+        extra='ignore',
+    )
+
+    host: str = '0.0.0.0'
+    port: int = 8000
+    workers_count: int | None = None  # sized from CPUs and the DB connection budget when unset
+    backlog: int = 2048
+    keep_alive_seconds: int = 5
+    limit_concurrency: int | None = None
+    limit_max_requests: int | None = 10000
+    limit_max_requests_jitter: int = 1000
+    reuse_port: bool = False
+
+
+class CompressionSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file='.env',
+        env_prefix='COMPRESSION_',
+        env_file_encoding='utf-8',
+        extra='ignore',
+    )
+
+    encodings: list[Literal['br', 'zstd', 'gzip']] = ['br', 'zstd', 'gzip']  # server preference
+    minimum_size: int = 1024
+    offload_size: int = 128 * 1024
+    compressible_types: list[str] = ['application/json', 'application/x-ndjson', 'text/']
+    brotli_quality: int = 4
+    zstd_level: int = 3
+    gzip_level: int = 6
 
 
 class DatabaseSettings(BaseSettings):
@@ -27,6 +65,28 @@ class DatabaseSettings(BaseSettings):
     user: str
     password: str
 
+    pool_size: int = 10
+    max_overflow: int = 15
+    pool_timeout_seconds: float = 30
+    pool_recycle_seconds: int = 1800
+    pool_pre_ping: bool = False  # pool_recycle and asyncpg disconnect errors cover dead connections
+    prepared_statement_cache_size: int = 100
+    statement_cache_size: int = 100
+    statement_timeout_ms: int = 0  # 0 disables the server-side timeout
+    connection_budget: int | None = None  # max connections all workers may open together
+    warmup_connections: int = 5
+
+    replica_hosts: list[str] = []
+    replica_retry_seconds: float = 30
+    read_your_writes_seconds: float = 5  # assumed replica lag until it has been measured
+    replica_lag_check_seconds: float = 1
+    written_at_cookie_max_age_seconds: int = 300
+
+    slow_query_threshold_ms: float | None = 200
+    slow_query_explain_sample_rate: float = 0.1
+    slow_query_explain_interval_seconds: float = 60
+    slow_query_explain_timeout_ms: int = 5000
+
 
 class AuthSettings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -40,6 +100,53 @@ class AuthSettings(BaseSettings):
     jwt_refresh_lifetime_minutes: int
     otp_expire_minutes: int
 
+    availability_filter_capacity: int = 1_000_000
+    availability_filter_error_rate: float = 0.01
+    availability_refresh_seconds: float = 30
+    availability_rate_per_second: float = 0.5  # per client IP
+    availability_burst: int = 10
+
+
+class FilesSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file='.env',
+        env_prefix='FILES_',
+        env_file_encoding='utf-8',
+        extra='ignore',
+    )
+
+    reservation_ttl_minutes: int = 30
+    transfer_shaping: bool = True
+    anonymous_transfer_rate: int = 1024 * 1024  # bytes per second, per client IP
+    anonymous_concurrent_transfers: int = 2
+    transfer_burst_seconds: float = 1.0
+    transfer_slot_timeout_seconds: float = 30
+    export_fetch_size: int = 1000
+    delta_block_size: int = 16 * 1024
+    upload_chunk_size: int = 4 * 1024 * 1024
+    upload_io_threads: int = 8
+    upload_durability: Literal['none', 'fdatasync', 'group'] = 'fdatasync'
+    upload_group_commit_window_ms: float = 0  # extra wait for more uploads to join a group sync
+    metadata_cache_size: int = 10_000  # file rows cached per worker
+    metadata_cache_channel: str = 'file_changes'
+    metadata_cache_health_check_seconds: float = 5
+    metadata_cache_reconnect_seconds: float = 1
+
+
+class IdempotencySettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file='.env',
+        env_prefix='IDEMPOTENCY_',
+        env_file_encoding='utf-8',
+        extra='ignore',
+    )
+
+    ttl_hours: int = 24
+    in_flight_timeout_seconds: float = 600
+    wait_timeout_seconds: float = 30
+    poll_interval_seconds: float = 0.1
+    sweep_interval_seconds: float = 3600
+
 
 class SMTPSettings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -56,6 +163,10 @@ class SMTPSettings(BaseSettings):
 
 
 app_settings = AppSettings()  # type: ignore[call-arg]
+server_settings = ServerSettings()  # type: ignore[call-arg]
+compression_settings = CompressionSettings()  # type: ignore[call-arg]
 db_settings = DatabaseSettings()  # type: ignore[call-arg]
 auth_settings = AuthSettings()  # type: ignore[call-arg]
+files_settings = FilesSettings()  # type: ignore[call-arg]
+idempotency_settings = IdempotencySettings()  # type: ignore[call-arg]
 smtp_settings = SMTPSettings()  # type: ignore[call-arg]
@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+import logging
+import random
+import re
+import time
+from collections.abc import Sequence
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.metrics import current_route
+from src.settings import db_settings
+
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+last_explain_at = 0.0
+explain_in_flight = False
+
+
+def normalize_sql(statement: str) -> str:
+    return WHITESPACE_RE.sub(' ', statement).strip()
+
+
+def parameters_shape(parameters: object, executemany: bool) -> str:
+    if executemany and isinstance(parameters, Sequence) and parameters:
+        return f'{len(parameters)} x {parameters_shape(parameters[0], False)}'
+
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in parameters.items()) + '}'
+
+    if isinstance(parameters, Sequence) and not isinstance(parameters, str | bytes):
+        return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+
+    return type(parameters).__name__
+
+
+def record_query(
+    engine: AsyncEngine,
+    statement: str,
+    parameters: object,
+    executemany: bool,
+    duration: float,
+) -> None:
+    threshold_ms = db_settings.slow_query_threshold_ms
+
+    if threshold_ms is None or duration * 1000 < threshold_ms or statement.startswith('EXPLAIN'):
+        return
+
+    sql = normalize_sql(statement)
+    logger.warning(
+        'Slow query %.1f ms on %s (route %s, parameters %s): %s',
+        duration * 1000,
+        engine.url.host,
+        current_route(),
+        parameters_shape(parameters, executemany),
+        sql,
+    )
+
+    if should_explain(sql, executemany):
+        asyncio.get_running_loop().create_task(
+            explain(engine, statement, parameters),
+            context=contextvars.Context(),
+        )
+
+
+def should_explain(sql: str, executemany: bool) -> bool:
+    global last_explain_at, explain_in_flight
+
+    if executemany or not sql.upper().startswith('SELECT') or 'FOR UPDATE' in sql.upper():
+        return False
+
+    if explain_in_flight or random.random() >= db_settings.slow_query_explain_sample_rate:
+        return False
+
+    now = time.monotonic()
+
+    if now - last_explain_at < db_settings.slow_query_explain_interval_seconds:
+        return False
+
+    last_explain_at = now
+    explain_in_flight = True
+
+    return True
+
+
+async def explain(engine: AsyncEngine, statement: str, parameters: object) -> None:
+    global explain_in_flight
+
+    try:
+        async with engine.connect() as connection:
+            await connection.exec_driver_sql(
+                f'SET LOCAL statement_timeout = {int(db_settings.slow_query_explain_timeout_ms)}'
+            )
+            result = await connection.exec_driver_sql(
+                f'EXPLAIN (ANALYZE, BUFFERS) {statement}',
+                tuple(parameters) if isinstance(parameters, Sequence) else (),
+            )
+            plan = '\n'.join(row[0] for row in result)
+            await connection.rollback()
+
+        logger.warning('Plan for slow query %s:\n%s', normalize_sql(statement), plan)
+    except Exception:
+        logger.exception('Could not capture plan for slow query.')
+    finally:
+        explain_in_flight = False